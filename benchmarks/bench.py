@@ -0,0 +1,225 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+from benchmarks.fake_github import FakeGithubState, start_server
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The github_repo_sync options of each mode. "cached" is a dry-run measured
+# after a first dry-run has filled the cache
+_MODES = {
+    'dry-run': [],
+    'cached': [],
+    'execute': ['-e', '-d'],
+}
+
+'''
+    Build the synthetic label scheme: 'count' labels with 'aliases' aliases
+    each, in the format of the JSON label scheme.
+
+    Arguments:
+        count: the number of labels in the scheme
+        aliases: the number of aliases of each label
+'''
+def make_label_scheme(count, aliases):
+    scheme = []
+    for index in range(count):
+        name = 'label-{0}'.format(index)
+        scheme.append({
+            'aliases': ['{0}-alias-{1}'.format(name, alias) for alias in range(aliases)],
+            'name': name,
+            'description': 'Scheme label {0}'.format(index),
+            'color': '#{0:06x}'.format(index * 2654435761 % 0xffffff)
+        })
+    return scheme
+
+'''
+    Build the labels and open issues of one synthetic repository. Most scheme
+    labels are present, some under one of their aliases and some with another
+    color; some are missing, and some labels are not in the scheme at all,
+    half of which are used by an open issue.
+
+    Arguments:
+        scheme: the label scheme from make_label_scheme()
+        rng: the random.Random to draw from
+'''
+def make_repo_labels(scheme, rng):
+    labels = []
+    issues = []
+    for scheme_label in scheme:
+        draw = rng.random()
+        color = scheme_label['color'].lstrip('#')
+        if draw < 0.05:
+            continue
+        elif draw < 0.45:
+            labels.append({ 'name': scheme_label['name'], 'color': color, 'description': scheme_label['description'] })
+        elif draw < 0.6:
+            labels.append({ 'name': scheme_label['name'], 'color': 'ededed', 'description': scheme_label['description'] })
+        elif scheme_label['aliases']:
+            labels.append({ 'name': rng.choice(scheme_label['aliases']), 'color': color, 'description': None })
+    for index in range(len(scheme) // 10):
+        name = 'unknown-{0}'.format(index)
+        labels.append({ 'name': name, 'color': 'cccccc', 'description': None })
+        if index % 2:
+            issues.append({ 'number': len(issues) + 1, 'labels': [name], 'pull_request': index % 4 == 1 })
+    return labels, issues
+
+'''
+    Build the fake GitHub state of a synthetic organization, always the same
+    for the same arguments.
+
+    Arguments:
+        scheme: the label scheme from make_label_scheme()
+        args: the benchmark arguments
+'''
+def make_state(scheme, args):
+    rng = random.Random(args.seed)
+    state = FakeGithubState(latency=args.latency / 1000.0)
+    for index in range(args.repos):
+        labels, issues = make_repo_labels(scheme, rng)
+        state.add_repo(args.org, 'repo-{0}'.format(index), labels, issues)
+    return state
+
+'''
+    Run github_repo_sync once against the fake server, in its own process.
+    Returns the wall time in seconds, the peak memory in MB and the exit code.
+
+    Arguments:
+        command: the github_repo_sync command line
+        log_path: the file the output of the run is written to
+'''
+def run_cli(command, log_path):
+    with open(log_path, 'w') as log:
+        start = time.perf_counter()
+        process = subprocess.Popen(command, cwd=_ROOT, stdin=subprocess.PIPE, stdout=log, stderr=subprocess.STDOUT)
+        # Answer the confirmation prompts of -e (execute) and -d (delete)
+        process.stdin.write(b'y\ny\n')
+        process.stdin.close()
+        _, status, usage = os.wait4(process.pid, 0)
+        elapsed = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux, and in bytes on macOS
+    peak = usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    return elapsed, peak, os.waitstatus_to_exitcode(status)
+
+'''
+    Run one benchmark mode against a fresh synthetic organization. Returns the
+    results of the mode.
+
+    Arguments:
+        mode: the name of the mode, one of _MODES
+        scheme: the label scheme from make_label_scheme()
+        work_dir: the directory for the schemes, cache and logs of the run
+        extra: extra github_repo_sync options for every run
+        args: the benchmark arguments
+'''
+def run_mode(mode, scheme, work_dir, extra, args):
+    state = make_state(scheme, args)
+    server = start_server(state)
+    try:
+        mode_dir = os.path.join(work_dir, mode)
+        os.makedirs(mode_dir)
+        labels_path = os.path.join(mode_dir, 'labels.json')
+        repos_path = os.path.join(mode_dir, 'repos.json')
+        with open(labels_path, 'w') as file:
+            json.dump(scheme, file)
+        with open(repos_path, 'w') as file:
+            json.dump([{ 'owner': owner, 'repository': repository } for owner, repository in state.repos], file)
+        command = [
+            sys.executable, '-m', 'github_repo_sync',
+            '-t', 'benchmark-token',
+            '--base-url', 'http://127.0.0.1:{0}'.format(server.server_port),
+            '-r', repos_path,
+            '-l', labels_path,
+            '--cache-dir', os.path.join(mode_dir, 'cache'),
+            '--write-interval', '0'
+        ] + _MODES[mode] + extra
+        if mode == 'cached':
+            run_cli(command, os.path.join(mode_dir, 'warmup.log'))
+            state.reset_requests()
+        elapsed, peak, returncode = run_cli(command, os.path.join(mode_dir, 'output.log'))
+        requests = state.total_requests()
+        return {
+            'mode': mode,
+            'returncode': returncode,
+            'seconds': round(elapsed, 3),
+            'peak_memory_mb': round(peak, 1),
+            'requests': requests,
+            'requests_per_repo': round(requests / float(args.repos), 2),
+            'not_modified': state.not_modified,
+            'endpoints': { '{0} {1}'.format(verb, endpoint): count for (verb, endpoint), count in sorted(state.requests.items()) },
+            'log': os.path.join(mode_dir, 'output.log')
+        }
+    finally:
+        server.shutdown()
+        server.server_close()
+
+'''
+    Print the results of every mode as a table, and the requests of each
+    endpoint with --by-endpoint.
+
+    Arguments:
+        results: the results of run_mode() for each mode
+        args: the benchmark arguments
+'''
+def print_results(results, args):
+    print("\r\n⏱️  BENCHMARK: {0} repos × {1} labels, {2} aliases per label, {3} ms latency".format(args.repos, args.labels, args.aliases, args.latency))
+    print("{0:<10} {1:>10} {2:>10} {3:>14} {4:>8} {5:>10} {6:>6}".format('mode', 'seconds', 'requests', 'requests/repo', '304s', 'peak MB', 'exit'))
+    for result in results:
+        print("{mode:<10} {seconds:>10.2f} {requests:>10} {requests_per_repo:>14.2f} {not_modified:>8} {peak_memory_mb:>10.1f} {returncode:>6}".format(**result))
+    if args.by_endpoint:
+        for result in results:
+            print("\r\n{0}".format(result['mode']))
+            for index, (endpoint, count) in enumerate(result['endpoints'].items()):
+                branch = "└──" if index == len(result['endpoints']) - 1 else "├──"
+                print("{0} {1:<48} {2:>8}".format(branch, endpoint, count))
+    for result in results:
+        if result['returncode'] != 0:
+            print("\r\n❌ The {0} run failed, its output is in '{1}' (with --keep)".format(result['mode'], result['log']))
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark github_repo_sync against a local fake GitHub API. Options after "--" are passed on to github_repo_sync, e.g. "-- -w 8 -g"')
+    parser.add_argument('--repos', help='Number of repositories in the synthetic organization', type=int, default=1000)
+    parser.add_argument('--labels', help='Number of labels in the label scheme, repositories have about as many', type=int, default=200)
+    parser.add_argument('--aliases', help='Number of aliases of each scheme label', type=int, default=3)
+    parser.add_argument('--latency', help='Latency of each fake GitHub API response, in milliseconds', type=float, default=0)
+    parser.add_argument('--modes', help='Comma separated modes to run, of {0}'.format(', '.join(_MODES)), default=','.join(_MODES))
+    parser.add_argument('--org', help='Login of the synthetic organization', default='bench-org')
+    parser.add_argument('--seed', help='Seed of the synthetic labels', type=int, default=1)
+    parser.add_argument('--by-endpoint', help='Print the number of requests of each endpoint', action='store_true')
+    parser.add_argument('--json', help='Also write the results to this JSON file, to compare runs')
+    parser.add_argument('--keep', help='Keep the schemes, cache and output of the runs instead of deleting them', action='store_true')
+    argv = sys.argv[1:]
+    extra = []
+    if '--' in argv:
+        extra = argv[argv.index('--') + 1:]
+        argv = argv[:argv.index('--')]
+    args = parser.parse_args(argv)
+
+    modes = [mode for mode in args.modes.split(',') if mode]
+    for mode in modes:
+        if mode not in _MODES:
+            parser.error("unknown mode '{0}'".format(mode))
+
+    scheme = make_label_scheme(args.labels, args.aliases)
+    work_dir = tempfile.mkdtemp(prefix='github_repo_sync_bench_')
+    try:
+        results = [run_mode(mode, scheme, work_dir, extra, args) for mode in modes]
+        print_results(results, args)
+        if args.json:
+            with open(args.json, 'w') as file:
+                json.dump({ 'arguments': vars(args), 'options': extra, 'results': results }, file, indent=4)
+    finally:
+        if args.keep:
+            print("\r\n📁 The runs have been kept in '{0}'".format(work_dir))
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,291 @@
+import re
+import json
+import time
+import hashlib
+import threading
+import collections
+import urllib.parse
+import http.server
+
+# A stand-in for the parts of the GitHub REST and GraphQL APIs used by
+# github_repo_sync, serving synthetic organizations from memory. It is only
+# as faithful as the benchmarks need it to be
+
+_RATE_LIMIT = 5000
+_LABELS_PER_GRAPHQL_PAGE = 100
+
+class FakeGithubState:
+    def __init__(self, username='bench', latency=0.0):
+        # repos maps ("owner", "repository") to a dict with the "labels" of
+        # the repository and its open "issues", each a dict with its label
+        # names and whether it is a pull request
+        self.username = username
+        self.latency = latency
+        # The user is a member of every organization owning a repository,
+        # unless it is in non_member_orgs
+        self.orgs = []
+        self.non_member_orgs = set()
+        self.repos = {}
+        self.requests = collections.Counter()
+        self.not_modified = 0
+        self.lock = threading.Lock()
+
+    def add_repo(self, owner, repository, labels, issues=None, **meta):
+        if owner != self.username and owner not in self.orgs:
+            self.orgs.append(owner)
+        self.repos[(owner, repository)] = { 'labels': labels, 'issues': issues or [], 'meta': meta }
+
+    def count(self, verb, endpoint):
+        with self.lock:
+            self.requests[(verb, endpoint)] += 1
+
+    def total_requests(self):
+        with self.lock:
+            return sum(self.requests.values())
+
+    def reset_requests(self):
+        with self.lock:
+            self.requests.clear()
+            self.not_modified = 0
+
+class FakeGithubHandler(http.server.BaseHTTPRequestHandler):
+    # Keep-alive connections like the real API. The headers and the body are
+    # written separately, so without TCP_NODELAY Nagle's algorithm holds the
+    # body back until the client acknowledges the headers, adding about 40 ms
+    # (the delayed ACK) to every response
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PATCH(self):
+        self._handle('PATCH')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+    def _handle(self, verb):
+        if self.state.latency:
+            time.sleep(self.state.latency)
+        url = urllib.parse.urlparse(self.path)
+        self._path = urllib.parse.unquote(url.path)
+        self._query = { key: values[0] for key, values in urllib.parse.parse_qs(url.query).items() }
+        length = int(self.headers.get('Content-Length') or 0)
+        self._body = json.loads(self.rfile.read(length)) if length else None
+        for pattern, verbs, endpoint in _ROUTES:
+            match = re.match(pattern, self._path)
+            if match and verb in verbs:
+                self.state.count(verb, endpoint)
+                with self.state.lock:
+                    return verbs[verb](self, *match.groups())
+        self.state.count(verb, 'other')
+        self._send(404, { 'message': 'Not Found' })
+
+    def _send(self, status, body=None, headers=None):
+        data = b'' if body is None else json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('X-RateLimit-Limit', str(_RATE_LIMIT))
+        self.send_header('X-RateLimit-Remaining', str(_RATE_LIMIT - 1))
+        self.send_header('X-RateLimit-Reset', str(int(time.time()) + 3600))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_page(self, items):
+        # Pages like the REST API, with Link headers and an ETag which is
+        # revalidated with If-None-Match. Like GitHub's, the ETag only covers
+        # the items of the page, not its links
+        per_page = int(self._query.get('per_page', 30))
+        page = int(self._query.get('page', 1))
+        last = max(1, -(-len(items) // per_page))
+        links = []
+        for rel, number in (('next', page + 1), ('last', last)):
+            if page < last:
+                query = dict(self._query, page=number)
+                links.append('<http://{0}{1}?{2}>; rel="{3}"'.format(self.headers['Host'], self._path, urllib.parse.urlencode(query), rel))
+        body = items[(page - 1) * per_page:page * per_page]
+        headers = { 'Link': ', '.join(links) } if links else {}
+        etag = '"{0}"'.format(hashlib.sha1(json.dumps(body).encode('utf-8')).hexdigest())
+        headers['ETag'] = etag
+        if self.headers.get('If-None-Match') == etag:
+            self.state.not_modified += 1
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self._send(200, body, headers)
+
+    def _repo(self, owner, repository):
+        repo = self.state.repos.get((owner, repository))
+        if repo is None:
+            self._send(404, { 'message': 'Not Found' })
+        return repo
+
+    def _label_json(self, owner, repository, label):
+        url = 'http://{0}/repos/{1}/{2}/labels/{3}'.format(self.headers['Host'], owner, repository, urllib.parse.quote(label['name']))
+        return { 'name': label['name'], 'color': label['color'], 'description': label.get('description'), 'url': url }
+
+    def _find_label(self, repo, name):
+        for label in repo['labels']:
+            if label['name'] == name:
+                return label
+        self._send(404, { 'message': 'Not Found' })
+
+    def get_user(self):
+        self._send(200, { 'login': self.state.username, 'id': 1, 'url': 'http://{0}/users/{1}'.format(self.headers['Host'], self.state.username) })
+
+    def get_user_orgs(self):
+        self._send_page([{ 'login': org, 'id': index + 2 } for index, org in enumerate(self.state.orgs) if org not in self.state.non_member_orgs])
+
+    def get_rate_limit(self):
+        core = { 'limit': _RATE_LIMIT, 'remaining': _RATE_LIMIT - 1, 'reset': int(time.time()) + 3600, 'used': 1 }
+        self._send(200, { 'resources': { 'core': core, 'search': core, 'graphql': core }, 'rate': core })
+
+    def get_owner(self, kind, login):
+        self._send(200, { 'login': login, 'id': 2, 'url': 'http://{0}/{1}/{2}'.format(self.headers['Host'], kind, login) })
+
+    def get_org_repos(self, org):
+        repos = []
+        for (owner, repository), repo in self.state.repos.items():
+            if owner != org:
+                continue
+            visibility = repo['meta'].get('visibility', 'public')
+            repos.append({
+                'name': repository,
+                'full_name': '{0}/{1}'.format(owner, repository),
+                'owner': { 'login': owner },
+                'archived': repo['meta'].get('archived', False),
+                'fork': repo['meta'].get('fork', False),
+                'visibility': visibility,
+                'private': visibility != 'public',
+                'topics': repo['meta'].get('topics', [])
+            })
+        self._send_page(repos)
+
+    def get_repo(self, owner, repository):
+        if self._repo(owner, repository) is not None:
+            url = 'http://{0}/repos/{1}/{2}'.format(self.headers['Host'], owner, repository)
+            self._send(200, { 'name': repository, 'full_name': '{0}/{1}'.format(owner, repository), 'owner': { 'login': owner }, 'url': url })
+
+    def get_labels(self, owner, repository):
+        repo = self._repo(owner, repository)
+        if repo is not None:
+            self._send_page([self._label_json(owner, repository, label) for label in repo['labels']])
+
+    def post_label(self, owner, repository):
+        repo = self._repo(owner, repository)
+        if repo is None:
+            return
+        if any(label['name'] == self._body['name'] for label in repo['labels']):
+            return self._send(422, { 'message': 'Validation Failed', 'errors': [{ 'resource': 'Label', 'code': 'already_exists', 'field': 'name' }] })
+        label = { 'name': self._body['name'], 'color': self._body['color'], 'description': self._body.get('description') }
+        repo['labels'].append(label)
+        self._send(201, self._label_json(owner, repository, label))
+
+    def get_label(self, owner, repository, name):
+        repo = self._repo(owner, repository)
+        label = repo and self._find_label(repo, name)
+        if label is not None:
+            self._send(200, self._label_json(owner, repository, label))
+
+    def patch_label(self, owner, repository, name):
+        repo = self._repo(owner, repository)
+        label = repo and self._find_label(repo, name)
+        if label is not None:
+            label['name'] = self._body.get('new_name', label['name'])
+            label['color'] = self._body.get('color', label['color'])
+            if 'description' in self._body:
+                label['description'] = self._body['description']
+            self._send(200, self._label_json(owner, repository, label))
+
+    def delete_label(self, owner, repository, name):
+        repo = self._repo(owner, repository)
+        label = repo and self._find_label(repo, name)
+        if label is not None:
+            repo['labels'].remove(label)
+            self._send(204)
+
+    def get_issues(self, owner, repository):
+        repo = self._repo(owner, repository)
+        if repo is None:
+            return
+        wanted = set(filter(None, self._query.get('labels', '').split(',')))
+        issues = [issue for issue in repo['issues'] if wanted.issubset(issue['labels'])]
+        self._send_page([{ 'number': issue['number'], 'labels': [{ 'name': name } for name in issue['labels']] } for issue in issues])
+
+    def post_graphql(self):
+        query, variables = self._body['query'], self._body.get('variables') or {}
+        data, errors = {}, []
+        if '$cursor' in query:
+            key = (variables['owner'], variables['name'])
+            data['repository'] = { 'labels': self._graphql_labels(key, variables.get('cursor')) } if key in self.state.repos else None
+        else:
+            for alias, index in re.findall(r'(r(\d+)): repository', query):
+                key = (variables['owner' + index], variables['name' + index])
+                if key in self.state.repos:
+                    data[alias] = { 'labels': self._graphql_labels(key, None) }
+                else:
+                    data[alias] = None
+                    errors.append({ 'type': 'NOT_FOUND', 'path': [alias], 'message': 'Could not resolve to a Repository' })
+        response = { 'data': data }
+        if errors:
+            response['errors'] = errors
+        self._send(200, response)
+
+    def _graphql_labels(self, key, cursor):
+        repo = self.state.repos[key]
+        start = int(cursor or 0)
+        end = start + _LABELS_PER_GRAPHQL_PAGE
+        nodes = []
+        for label in repo['labels'][start:end]:
+            issues = [issue for issue in repo['issues'] if label['name'] in issue['labels']]
+            nodes.append({
+                'name': label['name'],
+                'color': label['color'],
+                'description': label.get('description'),
+                'issues': { 'totalCount': len([issue for issue in issues if not issue.get('pull_request')]) },
+                'pullRequests': { 'totalCount': len([issue for issue in issues if issue.get('pull_request')]) }
+            })
+        more = end < len(repo['labels'])
+        return { 'pageInfo': { 'hasNextPage': more, 'endCursor': str(end) if more else None }, 'nodes': nodes }
+
+_REPO = r'^/repos/([^/]+)/([^/]+)'
+_ROUTES = [
+    (r'^/user$', { 'GET': FakeGithubHandler.get_user }, '/user'),
+    (r'^/user/orgs$', { 'GET': FakeGithubHandler.get_user_orgs }, '/user/orgs'),
+    (r'^/rate_limit$', { 'GET': FakeGithubHandler.get_rate_limit }, '/rate_limit'),
+    (r'^/graphql$', { 'POST': FakeGithubHandler.post_graphql }, '/graphql'),
+    (r'^/orgs/([^/]+)/repos$', { 'GET': FakeGithubHandler.get_org_repos }, '/orgs/:org/repos'),
+    (r'^/(orgs|users)/([^/]+)$', { 'GET': FakeGithubHandler.get_owner }, '/:owners/:owner'),
+    (_REPO + r'$', { 'GET': FakeGithubHandler.get_repo }, '/repos/:owner/:repo'),
+    (_REPO + r'/labels$', { 'GET': FakeGithubHandler.get_labels, 'POST': FakeGithubHandler.post_label }, '/repos/:owner/:repo/labels'),
+    (_REPO + r'/labels/(.+)$', { 'GET': FakeGithubHandler.get_label, 'PATCH': FakeGithubHandler.patch_label, 'DELETE': FakeGithubHandler.delete_label }, '/repos/:owner/:repo/labels/:name'),
+    (_REPO + r'/issues$', { 'GET': FakeGithubHandler.get_issues }, '/repos/:owner/:repo/issues'),
+]
+
+'''
+    Start a fake GitHub API server for the state on a background thread.
+    Returns the server, its base URL is "http://127.0.0.1:{port}".
+
+    Arguments:
+        state: the FakeGithubState to serve
+        port: the port to listen on, any free port by default
+'''
+def start_server(state, port=0):
+    handler = type('StateHandler', (FakeGithubHandler,), { 'state': state })
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
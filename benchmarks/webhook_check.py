@@ -0,0 +1,141 @@
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+
+from benchmarks.fake_github import FakeGithubState, start_server
+from github_repo_sync.github.webhook import post_payload
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_SECRET = 'webhook-check-secret'
+
+# The label the recorded payload is about, as the label scheme has it
+_SCHEME = [{ 'aliases': [], 'name': 'bug', 'description': "Something isn't working", 'color': '#d73a4a' }]
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+'''
+    Wait for 'check' to return True, for up to 'timeout' seconds. Returns the
+    last result of 'check'.
+
+    Arguments:
+        check: the function to call, every 0.1 seconds
+        timeout: the number of seconds to wait for
+'''
+def wait_for(check, timeout):
+    deadline = time.time() + timeout
+    while not check() and time.time() < deadline:
+        time.sleep(0.1)
+    return check()
+
+def _is_listening(url):
+    try:
+        with urllib.request.urlopen(url):
+            return True
+    except OSError:
+        return False
+
+'''
+    Post a recorded label event, sent by the owner of the token, to a --serve
+    daemon running against the fake GitHub API, and check that the label it is
+    about is reconciled with the label scheme. Returns the problem found, or
+    None.
+
+    Arguments:
+        payload: the recorded payload of the label event
+        member: whether the owner of the token is a member of the organization
+            owning the repository; if not, the owner of the token also has a
+            repository of the same name, which must be left alone
+        work_dir: the directory for the scheme and the output of the daemon
+        args: the check arguments
+'''
+def run_check(payload, member, work_dir, args):
+    owner = payload['repository']['owner']['login']
+    repository = payload['repository']['name']
+    labels = lambda: [{ 'name': payload['label']['name'], 'color': payload['label']['color'], 'description': payload['label']['description'] }]
+    # The token of the daemon belongs to the sender of the event, e.g. a
+    # personal token of the user who edited the label by hand
+    username = payload['sender']['login']
+    state = FakeGithubState(username=username)
+    state.add_repo(owner, repository, labels())
+    if not member:
+        state.non_member_orgs.add(owner)
+        state.add_repo(username, repository, labels())
+    server = start_server(state)
+    labels_path = os.path.join(work_dir, 'labels.json')
+    with open(labels_path, 'w') as file:
+        json.dump(_SCHEME, file)
+    url = 'http://127.0.0.1:{0}/'.format(_free_port())
+    command = [
+        sys.executable, '-m', 'github_repo_sync',
+        '-t', 'webhook-check-token',
+        '--base-url', 'http://127.0.0.1:{0}'.format(server.server_port),
+        '-l', labels_path,
+        '--no-cache',
+        '--serve', '--listen', url[len('http://'):-1],
+        '--webhook-secret', _SECRET,
+        '--coalesce-delay', '0',
+        '--write-interval', '0',
+        '-e', '-y'
+    ]
+    with open(os.path.join(work_dir, 'output.log'), 'w') as log:
+        process = subprocess.Popen(command, cwd=_ROOT, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        if not wait_for(lambda: _is_listening(url), args.timeout):
+            return "the daemon is not listening on {0}".format(url)
+        status, response = post_payload(url, 'label', json.dumps(payload).encode('utf-8'), _SECRET)
+        if status != 202 or 'Queued' not in response:
+            return "the event was not queued: {0} {1}".format(status, response)
+        label = lambda: state.repos[(owner, repository)]['labels'][0]
+        if not wait_for(lambda: label()['color'] == _SCHEME[0]['color'].lstrip('#'), args.timeout):
+            return "the label was not reconciled, it is {0}".format(label())
+        if not member and state.repos[(username, repository)]['labels'] != labels():
+            return "the repository '{0}/{1}' has been changed instead".format(username, repository)
+        return None
+    finally:
+        process.terminate()
+        process.wait()
+        server.shutdown()
+        server.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Check that a --serve daemon reconciles a recorded label event, against a local fake GitHub API')
+    parser.add_argument('--payload', help='The recorded payload of a label event', default=os.path.join(_ROOT, 'benchmarks', 'payloads', 'label_edited.json'))
+    parser.add_argument('--timeout', help='Number of seconds to wait for the daemon', type=float, default=20)
+    parser.add_argument('--keep', help='Keep the scheme and output of the daemon instead of deleting them', action='store_true')
+    args = parser.parse_args()
+
+    with open(args.payload, 'r') as file:
+        payload = json.load(file)
+    work_dir = tempfile.mkdtemp(prefix='github_repo_sync_webhook_')
+    failed = False
+    try:
+        for member in (True, False):
+            case = "a member" if member else "not a member"
+            case_dir = os.path.join(work_dir, 'member' if member else 'non-member')
+            os.makedirs(case_dir)
+            problem = run_check(payload, member, case_dir, args)
+            if problem is not None:
+                failed = True
+                print("❌ Webhook check failed, '{0}' {1} of '{2}': {3}".format(payload['sender']['login'], case, payload['repository']['owner']['login'], problem))
+            else:
+                print("✅ Webhook check passed, '{0}' {1} of '{2}': the '{3}' label has been reconciled".format(payload['sender']['login'], case, payload['repository']['owner']['login'], payload['label']['name']))
+    finally:
+        if args.keep:
+            print("📁 The output of the daemons has been kept in '{0}'".format(work_dir))
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
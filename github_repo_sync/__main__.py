@@ -1,19 +1,63 @@
+import os
 import argparse
 import logging
 
 from github_repo_sync.github.authenticator import GithubAuthenticator
+from github_repo_sync.github.cache import GithubResponseCache
+from github_repo_sync.github.state import GithubStateStore
+from github_repo_sync.github.scheduler import GithubRequestScheduler
+from github_repo_sync.github.profiler import GithubRequestProfiler
+from github_repo_sync.github.transport import GithubTransport
+from github_repo_sync.github.credentials import load_credentials
 
 import github_repo_sync.github.label.lib as lib
 import github_repo_sync.const as const
 
 parser = argparse.ArgumentParser(description='Synchronize GitHub repositories from a set scheme accross an organization')
 required_args = parser.add_argument_group('required arguments')
-required_args.add_argument('-t', '--token', help='GitHub personal access token. Generated here: https://github.com/settings/tokens', required=True)
+required_args.add_argument('-t', '--token', help='GitHub personal access token. Generated here: https://github.com/settings/tokens. Can be given more than once, the repositories are then sharded across one worker process per token. Not needed with --app-id', action='append')
 optional_args = parser.add_argument_group('optional arguments')
+optional_args.add_argument('--app-id', help='ID of a GitHub App to authenticate as, each of its installations (on the -o/--org organizations only, if given) is used like a -t/--token of its own')
+optional_args.add_argument('--app-key', help='Private key file (PEM) of the --app-id GitHub App')
 optional_args.add_argument('-r', '--repos', help='GitHub repository scheme. A JSON list of "owner" and "repository" bundled keys', default="schemes/repos/default.json")
+optional_args.add_argument('-o', '--org', help='Discover the repositories of this GitHub organization instead of loading a repository scheme. Can be given more than once', action='append')
+optional_args.add_argument('--include-archived', help='Include the archived repositories of the -o/--org organizations', action='store_true')
+optional_args.add_argument('--include-forks', help='Include the forked repositories of the -o/--org organizations', action='store_true')
+optional_args.add_argument('--visibility', help='Only include the repositories of the -o/--org organizations with this visibility', choices=['all', 'public', 'private', 'internal'], default='all')
+optional_args.add_argument('--topic', help='Only include the repositories of the -o/--org organizations with this topic. Can be given more than once, repositories need all of them', action='append')
+optional_args.add_argument('--name-pattern', help='Only include the repositories of the -o/--org organizations with a name matching this shell-style pattern, e.g. "api-*"')
 optional_args.add_argument('-l', '--labels', help='GitHub label scheme. A JSON list of "aliases" (list), "name", "description", and "color" bundled keys', default="schemes/labels/default.json")
+optional_args.add_argument('-i', '--ignore-case', help='Match repo labels to scheme label names and aliases case-insensitively', action='store_true')
 optional_args.add_argument('-e', '--execute', help='Execute the changes (adding new labels and editing labels only). Without this only a dry-run happens', action='store_true')
 optional_args.add_argument('-d', '--delete', help='Deletes any repo label that is not associated with the scheme, and has not associated open issues or PRs. This needs to be used in conjunction with -e/--execute', action='store_true')
+optional_args.add_argument('-p', '--plan', help='Write the planned changes of every repository to this JSON file, to be reviewed and applied later with -a/--apply')
+optional_args.add_argument('-a', '--apply', help='Apply a plan written with -p/--plan instead of scanning the repositories against the schemes. Delete candidates are only deleted with -d/--delete')
+optional_args.add_argument('--serve', help='Run as a daemon, reconciling a repository against the schemes whenever one of its label or repository webhook events is received, instead of scanning the repositories', action='store_true')
+optional_args.add_argument('--listen', help='Address and port the --serve daemon listens on for webhooks', default='127.0.0.1:8080')
+optional_args.add_argument('--webhook-secret', help='Secret of the webhooks, deliveries not signed with it are rejected. Defaults to the GITHUB_WEBHOOK_SECRET environment variable', default=os.environ.get('GITHUB_WEBHOOK_SECRET'))
+optional_args.add_argument('--coalesce-delay', help='Number of seconds the --serve daemon waits after the last event of a repository before reconciling it, so bursts of events are handled at once', type=float, default=5.0)
+optional_args.add_argument('-g', '--graphql', help='Fetch the labels, and their open issue and PR counts, of many repositories at once with the GraphQL API', action='store_true')
+optional_args.add_argument('--graphql-batch', help='Number of repositories fetched with each GraphQL query', type=int, default=25)
+optional_args.add_argument('-w', '--workers', help='Number of repositories to scan at the same time', type=int, default=1)
+optional_args.add_argument('--cache-dir', help='Directory of the cache of label listings, which are revalidated with their ETag on the next run', default=os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'github_repo_sync'))
+optional_args.add_argument('--cache-size', help='Maximum size of the cache in MB, least recently used responses are evicted first', type=int, default=50)
+optional_args.add_argument('--no-cache', help='Do not read or write the cache of label listings', action='store_true')
+optional_args.add_argument('--state', help='SQLite database recording the repositories found in sync. Repositories whose labels and label scheme have not changed since are skipped', metavar='STATE_DB')
+optional_args.add_argument('--state-ttl', help='Number of hours after which a repository recorded in the --state database is fully checked again', type=float, default=168)
+optional_args.add_argument('--full-scan', help='Check every repository, even the ones recorded as unchanged in the --state database', action='store_true')
+optional_args.add_argument('--base-url', help='Base URL of the GitHub API, for GitHub Enterprise Server e.g. "https://github.example.com/api/v3"', default='https://api.github.com')
+optional_args.add_argument('--timeout', help='Number of seconds to wait for a response from GitHub before giving up on (or retrying) the request', type=float, default=15)
+optional_args.add_argument('--pool-size', help='Number of connections to GitHub kept open for the next requests, by default one per worker (-w/--workers) and one for the main thread', type=int)
+optional_args.add_argument('--request-interval', help='Minimum number of seconds between two requests of the same worker, 0 to not wait at all', type=float, default=0.25)
+optional_args.add_argument('--max-retries', help='Number of times a request is retried after a secondary rate limit, 429 or 5xx response', type=int, default=5)
+optional_args.add_argument('--write-interval', help='Minimum number of seconds between two changes, across all workers, to stay under the secondary rate limits', type=float, default=1.0)
+optional_args.add_argument('--rate-limit-reserve', help='Part of the rate limit that is never spent by the run', type=int, default=100)
+optional_args.add_argument('--on-rate-limit', help='What to do when the rate limit budget is not enough for the next repository: wait for the reset, or stop and skip the remaining repositories', choices=['wait', 'stop'], default='wait')
+optional_args.add_argument('-q', '--quiet', help='Only print the summary across all repos, and the repositories that could not be scanned or changed, instead of the checks of every label', action='store_true')
+optional_args.add_argument('--events', help='Write every check and change of every repository to this file, as one JSON event per line')
+optional_args.add_argument('--profile', help='Record every request made to GitHub, and print the time spent on each endpoint and the latency histograms of each phase once the run is done', action='store_true')
+optional_args.add_argument('--profile-dump', help='Write the timing of every request to this file, as one JSON object per line. Implies --profile')
+optional_args.add_argument('-y', '--yes', help='Do not ask for confirmation before making changes, e.g. when running as a --serve daemon', action='store_true')
 optional_args.add_argument('-v', '--verbose', help='Turn on verbose logging', action='store_true')
 args = parser.parse_args()
 
@@ -22,26 +66,93 @@ print("\r\n>> GitHub Repo Sync —— Xander Jones —— v" + const.VERSION)
 if args.verbose:
     logging.basicConfig(level=logging.INFO)
 
-labels = lib.load_labels_scheme(args)
-repositories = lib.load_repos_scheme(args)
+if not args.token and not args.app_id:
+    print("\r\n>> A token is needed, use -t/--token, or --app-id and --app-key to authenticate as a GitHub App")
+    exit(1)
+
+if args.app_id and not args.app_key:
+    print("\r\n>> The private key of the GitHub App is needed with --app-id, use --app-key")
+    exit(1)
+
+if args.pool_size is None:
+    args.pool_size = max(1, args.workers) + 1
+
+if args.serve and not args.webhook_secret:
+    print("\r\n>> A webhook secret is needed with --serve, use --webhook-secret or GITHUB_WEBHOOK_SECRET")
+    exit(1)
+
+if not args.apply:
+    labels = lib.load_labels_scheme(args)
+    if not args.org and not args.serve:
+        repositories = lib.load_repos_scheme(args)
 
 print("\r\n🌐 CONNECTING TO GITHUB")
-gh = GithubAuthenticator(args.token)
+try:
+    credentials = load_credentials(args)
+except Exception as e:
+    print("└── Unable to load the installations of the GitHub App: {0} - exiting".format(e))
+    exit(1)
+if not credentials:
+    print("└── The GitHub App is not installed on any of the organizations - exiting")
+    exit(1)
+profiler = GithubRequestProfiler() if args.profile or args.profile_dump else None
+transport = GithubTransport(args.pool_size)
+pool = [GithubAuthenticator(credential, max_retries=args.max_retries, base_url=args.base_url, profiler=profiler, transport=transport, timeout=args.timeout, request_interval=args.request_interval) for credential in credentials]
+gh = pool[0]
 
-if gh.is_authenticated():
-    print("├── Authorized to GitHub as user '{0}'".format(gh.get_username()))
-    print("└── Rate limit: {0}, remaining: {1}".format(gh.get_rate_limit().core.limit, gh.get_rate_limit().core.remaining))
-    if args.execute:
+if all(member.is_authenticated() for member in pool):
+    print("├── Authorized to GitHub as user '{0}'{1}".format(gh.get_username(), " on '{0}'".format(credentials[0]['account']) if 'account' in credentials[0] else ""))
+    print("├── Rate limit: {0}, remaining: {1}".format(gh.get_rate_limit().core.limit, gh.get_rate_limit().core.remaining))
+    if len(pool) > 1:
+        if args.apply or args.serve:
+            print("├── ⚠️  {0} more credentials, only the first one is used with -a/--apply and --serve".format(len(pool) - 1))
+        else:
+            print("├── {0} more credentials, the repositories are sharded across a worker process for each".format(len(pool) - 1))
+        for index, member in enumerate(pool[1:]):
+            branch = "└──" if index == len(pool) - 2 else "├──"
+            account = " on '{0}'".format(credentials[index + 1]['account']) if 'account' in credentials[index + 1] else ""
+            print("│   {0} Authorized as '{1}'{2}, remaining: {3}".format(branch, member.get_username(), account, member.get_rate_limit().core.remaining))
+    gh.set_scheduler(GithubRequestScheduler(reserve=args.rate_limit_reserve, write_interval=args.write_interval, wait=args.on_rate_limit == 'wait'))
+    gh.get_scheduler().observe()
+    branch = "├──" if args.state else "└──"
+    if args.no_cache:
+        print("{0} Response cache disabled".format(branch))
+    else:
+        cache_dir = lib.get_cache_dir(gh, args)
+        gh.set_cache(GithubResponseCache(cache_dir, args.cache_size * 1024 * 1024))
+        print("{0} Response cache: '{1}'".format(branch, cache_dir))
+    if args.state:
+        gh.set_state(GithubStateStore(args.state, args.state_ttl * 3600))
+        print("└── State store: '{0}'{1}".format(args.state, ", ignored by --full-scan" if args.full_scan else ""))
+    if (args.execute or args.apply) and not args.yes:
         approve = input("🔒  You've enabled --execute. This will update and add new labels. Are you sure? [Y/n]: ")
         if not approve.lower() == "y":
             print(">> User did not authorize changes")
             exit(1)
-    if args.delete:
+    if args.delete and not args.yes:
         approve = input("🔒  You've enabled --delete. This will delete labels that do not match the scheme and have no associated open issues/PRs. Are you sure? [Y/n]: ")
         if not approve.lower() == "y":
             print(">> User did not authorize changes")
             exit(1)
-    lib.scan_repos(gh.get_auth(), repositories, labels, args)
+    try:
+        if args.apply:
+            lib.apply_plan(gh, args)
+        elif args.serve:
+            lib.serve(gh, labels, args)
+        else:
+            if args.org:
+                repositories = lib.discover_repos_scheme(gh, args, pool)
+            lib.scan_repos(gh, repositories, labels, args, pool)
+    finally:
+        if gh.get_state() is not None:
+            gh.get_state().close()
+        if profiler is not None:
+            profiler.print_summary()
+            if args.profile_dump:
+                profiler.dump(args.profile_dump)
+                print("└── The timing of every request has been written to '{0}'".format(args.profile_dump))
+            transport.print_stats()
+        transport.close()
 
 else:
     print("└── Unable to authenticate with GitHub - exiting")
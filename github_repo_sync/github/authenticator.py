@@ -1,5 +1,12 @@
 import logging
+import threading
 import github
+import github.Requester
+
+from github_repo_sync.github.scheduler import get_scheduler_connection_classes
+from github_repo_sync.github.resolver import GithubOwnerResolver
+from github_repo_sync.github.transport import GithubTransport
+from github_repo_sync.github.credentials import make_auth
 
 class GithubAuthenticator:
     _authenticated = False
@@ -7,19 +14,101 @@ class GithubAuthenticator:
     _rate_limit = []
     _username = []
 
-    def __init__(self, github_token):
-        self._github_login = github.Github(github_token)
+    def __init__(self, credential, max_retries=5, base_url=github.Consts.DEFAULT_BASE_URL, profiler=None, transport=None, timeout=15, request_interval=0.25):
+        # credential is a token or an app installation, see load_credentials()
+        self._credential = credential
+        # The transport shares its connections between every client, the
+        # profiler records every HTTP call of every client, and the scheduler
+        # keeps track of the rate limit resource of every response, so their
+        # connection classes have to be in place before the first client is
+        # created. Once injected, PyGithub no longer keeps a connection per
+        # client, so there always is a transport
+        self._profiler = profiler
+        self._transport = transport if transport is not None else GithubTransport()
+        classes = self._transport.get_connection_classes()
+        if profiler is not None:
+            classes = profiler.get_connection_classes(classes)
+        github.Requester.Requester.injectConnectionClasses(*get_scheduler_connection_classes(classes))
+        # Failed requests (secondary rate limits, 429 and 5xx responses) are
+        # retried with an exponential backoff, honouring Retry-After. Writes
+        # are paced by the GithubRequestScheduler across all the clients
+        # rather than by each client. Listings are paged through 100 items at
+        # a time, the most the API allows
+        self._github_options = {
+            'retry': github.GithubRetry(
+                total=max_retries,
+                backoff_factor=1,
+                status_forcelist=[429] + list(range(500, 600)),
+                allowed_methods=['DELETE', 'GET', 'HEAD', 'PATCH', 'POST']),
+            'seconds_between_requests': request_interval or None,
+            'seconds_between_writes': None,
+            'timeout': timeout,
+            'per_page': 100,
+            'base_url': base_url,
+            'auth': make_auth(credential)
+        }
+        self._github_login = github.Github(**self._github_options)
+        self._thread_logins = threading.local()
+        self._thread_logins.login = self._github_login
+        self._resolver = GithubOwnerResolver(self)
+        self._cache = None
+        self._state = None
+        self._scheduler = None
         try:
-            self._username = self._github_login.get_user().login
+            if 'account' in credential:
+                # An app installation can't look itself up as a user, and only
+                # has access to the repositories of its account
+                self._username = credential['login']
+                self._resolver.add_org(credential['account'])
+            else:
+                self._username = self._github_login.get_user().login
+            rate_limit = self._github_login.get_rate_limit()
         except Exception as e:
             self._authenticated = False
             logging.error("Unable to login: " + str(e))
         else:
             self._authenticated = True
-            self._rate_limit = self._github_login.get_rate_limit()
+            # Newer versions of PyGithub wrap the per resource limits
+            self._rate_limit = getattr(rate_limit, 'resources', rate_limit)
 
     def get_auth(self):
-        return self._github_login
+        # PyGithub keeps one persistent connection per client, which can't be
+        # shared between threads, so each worker thread gets its own client
+        login = getattr(self._thread_logins, 'login', None)
+        if login is None:
+            login = github.Github(**self._github_options)
+            self._thread_logins.login = login
+        return login
+
+    def get_credential(self):
+        return self._credential
+
+    def get_transport(self):
+        return self._transport
+
+    def get_profiler(self):
+        return self._profiler
+
+    def get_resolver(self):
+        return self._resolver
+
+    def get_cache(self):
+        return self._cache
+
+    def set_cache(self, cache):
+        self._cache = cache
+
+    def get_state(self):
+        return self._state
+
+    def set_state(self, state):
+        self._state = state
+
+    def get_scheduler(self):
+        return self._scheduler
+
+    def set_scheduler(self, scheduler):
+        self._scheduler = scheduler
 
     def get_username(self):
         if self.is_authenticated:
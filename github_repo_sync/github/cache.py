@@ -0,0 +1,76 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+
+class GithubResponseCache:
+    def __init__(self, cache_dir, max_size):
+        # max_size is in bytes. Entries are evicted least recently used first
+        # once the cache grows past it
+        self._cache_dir = cache_dir
+        self._max_size = max_size
+        self._entries = {}
+        self._size = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        for entry in os.scandir(cache_dir):
+            if entry.is_file() and entry.name.endswith('.json'):
+                stat = entry.stat()
+                self._entries[entry.name] = (stat.st_size, stat.st_mtime)
+                self._size += stat.st_size
+
+    def _key(self, url):
+        return hashlib.sha256(url.encode('utf-8')).hexdigest() + '.json'
+
+    def get(self, url):
+        # Returns the cached response of the url, a dict with its "etag",
+        # "data" and "next" page url, or None if the url is not cached
+        key = self._key(url)
+        with self._lock:
+            if key not in self._entries:
+                return None
+            path = os.path.join(self._cache_dir, key)
+            try:
+                with open(path, 'r') as file:
+                    response = json.load(file)
+                os.utime(path)
+            except (OSError, ValueError) as e:
+                logging.info("dropping unreadable cache entry for '{0}': {1}".format(url, e))
+                self._remove(key)
+                return None
+            self._entries[key] = (self._entries[key][0], time.time())
+        if response.get('url') != url:
+            return None
+        return response
+
+    def put(self, url, etag, data, next_url):
+        if not etag:
+            return
+        key = self._key(url)
+        content = json.dumps({ 'url': url, 'etag': etag, 'data': data, 'next': next_url })
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries[key][0]
+            with open(os.path.join(self._cache_dir, key), 'w') as file:
+                file.write(content)
+            self._entries[key] = (len(content), time.time())
+            self._size += len(content)
+            self._evict()
+
+    def _remove(self, key):
+        size, _ = self._entries.pop(key)
+        self._size -= size
+        try:
+            os.remove(os.path.join(self._cache_dir, key))
+        except OSError:
+            pass
+
+    def _evict(self):
+        if self._size <= self._max_size:
+            return
+        for key in sorted(self._entries, key=lambda key: self._entries[key][1]):
+            self._remove(key)
+            if self._size <= self._max_size:
+                break
@@ -0,0 +1,69 @@
+import zlib
+import logging
+import github
+
+'''
+    Build the pool of credentials of the run: one per -t (token), and one per
+    installation of the GitHub App given with --app-id and --app-key. With the
+    -o (org) option, only the installations on those organizations are used.
+    Each credential has a rate limit of its own. Credentials are plain dicts,
+    so they can be handed to the worker processes.
+
+    Arguments:
+        args: the user provided arguments from the main thread
+'''
+def load_credentials(args):
+    credentials = [{ 'token': token } for token in args.token or []]
+    if args.app_id:
+        with open(args.app_key, 'r') as file:
+            private_key = file.read()
+        integration = github.GithubIntegration(auth=github.Auth.AppAuth(args.app_id, private_key), base_url=args.base_url)
+        # Installations are bots, "<app slug>[bot]", scoped to the account
+        # (organization or user) the app is installed on
+        login = "{0}[bot]".format(integration.get_app().slug)
+        for installation in integration.get_installations():
+            account = installation.account.login
+            if args.org and account not in args.org:
+                continue
+            logging.info("using the installation {0} of the app on '{1}'".format(installation.id, account))
+            credentials.append({
+                'app_id': args.app_id,
+                'private_key': private_key,
+                'installation_id': installation.id,
+                'account': account,
+                'login': login
+            })
+    return credentials
+
+'''
+    Build the PyGithub authentication of a credential. The token of an app
+    installation is minted when it is first needed, and minted again before
+    it expires.
+
+    Arguments:
+        credential: a credential from load_credentials()
+'''
+def make_auth(credential):
+    if 'token' in credential:
+        return github.Auth.Token(credential['token'])
+    app_auth = github.Auth.AppAuth(credential['app_id'], credential['private_key'])
+    return github.Auth.AppInstallationAuth(app_auth, credential['installation_id'])
+
+'''
+    Pick the credential of the pool a repository is worked on with. Only the
+    credentials that can access the owner of the repository are considered
+    (an app installation only covers its own account), and among those the
+    repository always lands on the same one, so the response cache of that
+    credential stays warm from one run to the next. Returns the index of the
+    credential, or None if no credential of the pool covers the owner.
+
+    Arguments:
+        credentials: the credentials from load_credentials()
+        repo: the repository (an "owner" and "repository" bundle)
+'''
+def pick_credential(credentials, repo):
+    candidates = [index for index, credential in enumerate(credentials) if credential.get('account') in (None, repo['owner'])]
+    if not candidates:
+        return None
+    full_name = "{0}/{1}".format(repo['owner'], repo['repository'])
+    return candidates[zlib.crc32(full_name.encode('utf-8')) % len(candidates)]
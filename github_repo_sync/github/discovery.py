@@ -0,0 +1,45 @@
+import fnmatch
+import logging
+
+from github_repo_sync.github.pages import get_pages
+
+# Visibilities the organization repositories listing can filter on by itself
+_LISTING_TYPES = { 'public': 'public', 'private': 'private' }
+
+'''
+    Stream the repositories of an organization, page by page, as "owner" and
+    "repository" bundles like the ones of the repository scheme. Repositories
+    are yielded as soon as their page has been fetched, so they can be scanned
+    while the next pages are still to come. The organization is registered
+    with the resolver, so its repositories don't need to be resolved again.
+
+    Arguments:
+        gh: the GithubAuthenticator for the session
+        org: the login of the organization
+        args: the user provided arguments from the main thread, for the filters
+'''
+def discover_repos(gh, org, args):
+    gh.get_resolver().add_org(org)
+    requester = gh.get_auth().requester
+    url = "/orgs/{0}/repos?type={1}&per_page={2}".format(org, _LISTING_TYPES.get(args.visibility, 'all'), requester.per_page)
+    listed = 0
+    for repository in get_pages(requester, url, gh.get_cache()):
+        listed += 1
+        if _matches(repository, args):
+            yield { 'owner': repository['owner']['login'], 'repository': repository['name'] }
+    logging.info("listed {0} repositories of '{1}'".format(listed, org))
+
+def _matches(repository, args):
+    if repository.get('archived') and not args.include_archived:
+        return False
+    if repository.get('fork') and not args.include_forks:
+        return False
+    if args.visibility != 'all':
+        visibility = repository.get('visibility') or ('private' if repository.get('private') else 'public')
+        if visibility != args.visibility:
+            return False
+    if args.topic and not set(args.topic).issubset(repository.get('topics') or []):
+        return False
+    if args.name_pattern and not fnmatch.fnmatchcase(repository['name'], args.name_pattern):
+        return False
+    return True
@@ -0,0 +1,139 @@
+import logging
+import threading
+
+import github
+
+_LABELS_PER_PAGE = 100
+
+_LABEL_PAGE_FRAGMENT = """
+fragment LabelPage on LabelConnection {
+    pageInfo { hasNextPage endCursor }
+    nodes {
+        name
+        color
+        description
+        issues(states: OPEN) { totalCount }
+        pullRequests(states: OPEN) { totalCount }
+    }
+}
+"""
+
+_NEXT_PAGE_QUERY = """
+query($owner: String!, $name: String!, $cursor: String) {
+    repository(owner: $owner, name: $name) {
+        labels(first: %d, after: $cursor) { ...LabelPage }
+    }
+}
+""" % _LABELS_PER_PAGE + _LABEL_PAGE_FRAGMENT
+
+_ERROR_STATUS = { 'NOT_FOUND': 404, 'FORBIDDEN': 403 }
+
+class GraphqlLabelFetcher:
+    def __init__(self, gh, batch_size):
+        # Repositories are fetched in batches of batch_size, with one aliased
+        # GraphQL query per batch. A batch is fetched by the first worker that
+        # asks for one of its repositories
+        self._gh = gh
+        self._batch_size = batch_size
+        self._batches = []
+        self._batch_locks = []
+        self._batch_of = {}
+        self._fetched = set()
+        self._results = {}
+        self._lock = threading.Lock()
+
+    def stream(self, repositories):
+        # Groups the repositories into batches as they are streamed. The
+        # repositories of a batch are only passed on once it is full (or the
+        # stream has ended), so they are all fetched with the same query
+        batch = []
+        for repo in repositories:
+            batch.append(repo)
+            if len(batch) >= self._batch_size:
+                yield from self._add_batch(batch)
+                batch = []
+        if batch:
+            yield from self._add_batch(batch)
+
+    def _add_batch(self, batch):
+        with self._lock:
+            index = len(self._batches)
+            self._batches.append(batch)
+            self._batch_locks.append(threading.Lock())
+            for repo in batch:
+                self._batch_of[(repo['owner'], repo['repository'])] = index
+        return batch
+
+    def get_labels(self, repo):
+        # Returns the labels of the repository, in the same format as
+        # GithubLabelHandler.get_labels(), and the number of open issues and
+        # PRs of each label by name
+        key = (repo['owner'], repo['repository'])
+        with self._lock:
+            index = self._batch_of[key]
+            batch_lock = self._batch_locks[index]
+        with batch_lock:
+            if index not in self._fetched:
+                self._fetch_batch(self._batches[index])
+                self._fetched.add(index)
+            result = self._results[key]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def _query(self, query, variables):
+        requester = self._gh.get_auth().requester
+        _, data = requester.requestJsonAndCheck("POST", requester.graphql_url, input={ 'query': query, 'variables': variables })
+        return data
+
+    def _fetch_batch(self, batch):
+        variables = {}
+        parameters = []
+        fields = []
+        for index, repo in enumerate(batch):
+            variables['owner{0}'.format(index)] = self._gh.get_resolver().get_owner_login(repo['owner'])
+            variables['name{0}'.format(index)] = repo['repository']
+            parameters.append("$owner{0}: String!, $name{0}: String!".format(index))
+            fields.append("r{0}: repository(owner: $owner{0}, name: $name{0}) {{ labels(first: {1}) {{ ...LabelPage }} }}".format(index, _LABELS_PER_PAGE))
+        query = "query({0}) {{\n    {1}\n}}\n".format(", ".join(parameters), "\n    ".join(fields)) + _LABEL_PAGE_FRAGMENT
+        logging.info("fetching the labels of {0} repositories with GraphQL".format(len(batch)))
+
+        try:
+            data = self._query(query, variables)
+        except Exception as e:
+            for repo in batch:
+                self._results[(repo['owner'], repo['repository'])] = e
+            return
+
+        errors = {}
+        for error in data.get('errors', []):
+            if error.get('path'):
+                errors[error['path'][0]] = error
+        for index, repo in enumerate(batch):
+            key = (repo['owner'], repo['repository'])
+            alias = 'r{0}'.format(index)
+            repository = (data.get('data') or {}).get(alias)
+            if repository is None:
+                error = errors.get(alias, { 'message': 'No data returned for this repository' })
+                self._results[key] = github.GithubException(_ERROR_STATUS.get(error.get('type'), 400), error)
+                continue
+            try:
+                self._results[key] = self._read_labels(variables['owner{0}'.format(index)], repo['repository'], repository['labels'])
+            except Exception as e:
+                self._results[key] = e
+
+    def _read_labels(self, owner, name, page):
+        labels = []
+        open_issues = {}
+        while True:
+            for node in page['nodes']:
+                label_def = { "name": node['name'], "color": "#{0}".format(node['color']), "description": node['description'] }
+                labels.append(label_def)
+                open_issues[node['name']] = node['issues']['totalCount'] + node['pullRequests']['totalCount']
+            if not page['pageInfo']['hasNextPage']:
+                return labels, open_issues
+            # Repositories with more labels than fit in a page are followed up one by one
+            data = self._query(_NEXT_PAGE_QUERY, { 'owner': owner, 'name': name, 'cursor': page['pageInfo']['endCursor'] })
+            if data.get('errors'):
+                raise github.GithubException(400, data['errors'][0])
+            page = data['data']['repository']['labels']
@@ -1,17 +1,21 @@
+import urllib.parse
+import collections
 import github
 import logging
 
+from github_repo_sync.github.pages import get_pages, iter_pages
+
 class GithubLabelHandler:
-    def __init__(self, g, github_owner_name, github_repo_name, verbose=False):
+    def __init__(self, resolver, github_owner_name, github_repo_name, cache=None, labels=None, open_issues=None, verbose=False):
         assert isinstance(github_owner_name, str)
         assert isinstance(github_repo_name, str)
-        # Repository either owned by user or one of user's organization
-        orgs = [org.login for org in g.get_user().get_orgs()]
-        if github_owner_name in orgs:
-            owner = g.get_organization(github_owner_name)
-        else:
-            owner = g.get_user()
-        self._repo = owner.get_repo(github_repo_name)
+        self._repo = resolver.get_repo(github_owner_name, github_repo_name)
+        self._cache = cache
+        # Labels and their open issue counts that have already been fetched,
+        # e.g. with GraphQL, are used instead of asking the REST API again
+        self._labels = labels
+        self._open_issues = open_issues
+        self._label_urls = {}
         #logging.info("connected to repository '{0}/{1}'".format(owner.login, self._repo.name))
 
     def _find_label(self, name):
@@ -48,28 +52,63 @@ class GithubLabelHandler:
 
     def add_label(self, label_def):
         name, color, description, *_ = self._get_label_properties(label_def)
-        self._repo.create_label(name, color, description)
+        try:
+            self._repo.create_label(name, color, description)
+        except github.GithubException as e:
+            # Creates are retried after a 5xx, which GitHub may answer once
+            # the label has been created. If the label that already exists is
+            # the one we asked for, the create succeeded
+            if not self._is_already_created(e, name, color, description):
+                raise
+
+    def _is_already_created(self, error, name, color, description):
+        errors = error.data.get('errors', []) if error.status == 422 and isinstance(error.data, dict) else []
+        if not any(isinstance(item, dict) and item.get('code') == 'already_exists' for item in errors):
+            return False
+        label = self._find_label(name)
+        if label is None or label.color.lower() != color.lower():
+            return False
+        return description is github.GithubObject.NotSet or (label.description or '') == (description or '')
 
     def delete_label(self, label_def_or_name):
         if isinstance(label_def_or_name, str):
             name = label_def_or_name
         else:
             name, *_ = self._get_label_properties(label_def_or_name)
-        label = self._find_label(name)
-        if label:
-            label.delete()
-            return True
-        else:
-            return False
+        try:
+            self._repo._requester.requestJsonAndCheck("DELETE", self._label_url(name))
+        except github.UnknownObjectException as e:
+            return self._check_gone(name, e)
+        return True
 
     def edit_label(self, label_def, old_name):
         name, color, description = self._get_label_properties(label_def)
-        label = self._find_label(old_name)
-        if label:
-            label.edit(name, color, description)
-            return True
-        else:
+        patch = { "new_name": name, "color": color }
+        if description is not github.GithubObject.NotSet:
+            patch['description'] = description
+        try:
+            self._repo._requester.requestJsonAndCheck("PATCH", self._label_url(old_name), input=patch)
+        except github.UnknownObjectException as e:
+            return self._check_gone(old_name, e)
+        return True
+
+    def _check_gone(self, name, error):
+        # GitHub answers a change the token is not allowed to make with a 404
+        # too. Only if the label really is missing has it been renamed or
+        # deleted since it was listed (returns False), otherwise the 404 is
+        # raised again
+        logging.info(error)
+        if self._find_label(name) is None:
             return False
+        raise error
+
+    def _label_url(self, name):
+        # Labels are changed straight from the name they were listed with,
+        # without fetching them again first. A label that has been renamed or
+        # deleted since is answered with a 404
+        if name in self._label_urls:
+            return self._label_urls[name]
+        return "{0}/labels/{1}".format(self._repo.url, urllib.parse.quote(name, safe=''))
 
     def get_label(self, name):
         label = self._find_label(name)
@@ -81,16 +120,49 @@ class GithubLabelHandler:
         return label_def
 
     def get_labels(self):
+        if self._labels is not None:
+            return self._labels
         labels_def = []
-        repo_labels = self._repo.get_labels()
-        for label in repo_labels:
-            label_def = { "name" : label.name, "color": "#{0}".format(label.color) }
-            if label.description is not github.GithubObject.NotSet:
-                label_def['description'] = label.description
+        url = "{0}/labels?per_page={1}".format(self._repo.url, self._repo._requester.per_page)
+        for label in get_pages(self._repo._requester, url, self._cache):
+            label_def = { "name" : label['name'], "color": "#{0}".format(label['color']) }
+            if 'description' in label:
+                label_def['description'] = label['description']
+            if 'url' in label:
+                self._label_urls[label['name']] = label['url']
             labels_def.append(label_def)
         return labels_def
 
     def get_issues(self, label):
-        lbl = self._repo.get_label(label["name"])   # this could be made more efficient if we build the label type manually.
-        issues = self._repo.get_issues(state='open',sort='created',direction='asc',labels=[lbl])
-        return issues
\ No newline at end of file
+        issues = self._repo.get_issues(state='open',sort='created',direction='asc',labels=[label["name"]])
+        return issues
+
+    def count_open_issues(self, label):
+        if self._open_issues is not None and label["name"] in self._open_issues:
+            return self._open_issues[label["name"]]
+        return self.get_issues(label).totalCount
+
+    def get_open_label_usage(self, labels):
+        # Returns the number of open issues and PRs of each of the labels, by
+        # name. The open issues (PRs included) are listed once and their labels
+        # counted, instead of asking for the issues of each label. The listing
+        # is given up after as many pages as there are labels, when counting
+        # them one at a time is cheaper
+        names = [label["name"] for label in labels]
+        if not names:
+            return {}
+        if self._open_issues is not None and all(name in self._open_issues for name in names):
+            return { name: self._open_issues[name] for name in names }
+        usage = collections.Counter()
+        url = "{0}/issues?state=open&per_page={1}".format(self._repo.url, self._repo._requester.per_page)
+        pages = 0
+        # Issue pages are not cached, they are large and change all the time
+        for issues, next_url in iter_pages(self._repo._requester, url):
+            for issue in issues:
+                usage.update(set(issue_label["name"] for issue_label in issue["labels"]))
+            pages += 1
+            if next_url and pages >= len(names):
+                logging.info("'{0}' has more than {1} pages of open issues, counting them per label".format(self._repo.url, pages))
+                return { name: self.count_open_issues({ "name": name }) for name in names }
+        self._open_issues = dict(usage, **(self._open_issues or {}))
+        return { name: self._open_issues.get(name, 0) for name in names }
@@ -1,11 +1,37 @@
 import os
 import json
+import queue
+import signal
+import threading
+import multiprocessing
+import concurrent.futures
+
+import github
 
 from github_repo_sync.github.label.handler import GithubLabelHandler
+from github_repo_sync.github.label.scheme import LabelScheme
+from github_repo_sync.github.label.graphql import GraphqlLabelFetcher
+from github_repo_sync.github.label.report import RunReporter, ShardReporter
+from github_repo_sync.github.authenticator import GithubAuthenticator
+from github_repo_sync.github.cache import GithubResponseCache
+from github_repo_sync.github.state import GithubStateStore, GithubStateForwarder
+from github_repo_sync.github.scheduler import GithubRequestScheduler, SCAN_COST
+from github_repo_sync.github.profiler import GithubRequestProfiler
+from github_repo_sync.github.transport import GithubTransport
+from github_repo_sync.github.credentials import pick_credential
+from github_repo_sync.github.discovery import discover_repos
+from github_repo_sync.github.webhook import RepoQueue, WebhookServer
+
+import github_repo_sync.github.label.plan as plan
+
+_COUNT_KEYS = ('correct', 'missing_from_scheme', 'missing_from_repo', 'require_updates', 'failed_repos', 'stale_repos', 'skipped_repos', 'unchanged_repos')
 
 '''
-    Load the label scheme. This should be a JSON list of "owner" and
-    "repository" bundled keys'. If the file does not exist, the script will exit.
+    Load the label scheme. This should be a JSON list of "aliases" (list),
+    "name", "description", and "color" bundled keys. The scheme is compiled
+    into an index of label names and aliases, matched case-insensitively with
+    the -i (ignore case) option. Aliases that collide with another label's name
+    or alias are reported. If the file does not exist, the script will exit.
 
     Arguments:
         args: the user provided arguments from the main thread
@@ -15,7 +41,9 @@ def load_labels_scheme(args):
     if os.path.exists(args.labels):
         print("├── Using '{0}' label scheme".format(args.labels))
         with open(args.labels, 'r') as file:
-            labels = json.load(file)
+            labels = LabelScheme(json.load(file), ignore_case=args.ignore_case)
+        for name, label, existing in labels.collisions:
+            print("├── ⚠️  '{0}' of '{1}' is already used by '{2}', it will match '{2}'".format(name, label, existing))
         print("└── {0} labels have been loaded".format(str(len(labels))))
         return labels
     else:
@@ -42,36 +70,628 @@ def load_repos_scheme(args):
         print("└── File '{0}' does not exist".format(args.repos))
         exit(1)
 
+'''
+    Discover the repositories of the organizations given with the -o (org)
+    option, instead of loading a repository scheme. The repositories are
+    streamed, the first ones are scanned while the next ones are still being
+    discovered. An organization that can't be listed is reported and skipped.
+    With a pool of credentials, each organization is listed with a credential
+    that has access to it.
+
+    Arguments:
+        gh: the GithubAuthenticator for the session
+        args: the user provided arguments from the main thread
+        pool: the GithubAuthenticator of every credential, or None
+'''
+def discover_repos_scheme(gh, args, pool=None):
+    print("\r\n🗄️  DISCOVERING REPOS")
+    for index, org in enumerate(args.org):
+        branch = "└──" if index == len(args.org) - 1 else "├──"
+        print("{0} Streaming the repositories of '{1}'".format(branch, org))
+
+    def stream():
+        for org in args.org:
+            session = gh
+            if pool:
+                index = pick_credential([member.get_credential() for member in pool], { 'owner': org, 'repository': org })
+                session = pool[index] if index is not None else gh
+            try:
+                for repo in discover_repos(session, org, args):
+                    yield repo
+            except Exception as e:
+                print("\r\n❌ Error discovering the repositories of '{0}': {1}".format(org, _describe_error(e)))
+    return stream()
+
 '''
     A check to see if, for a given label 'repo_label', does it need to be edited
     to comply with the 'scheme_label'. This checks for the color and description
     only. Returns True if edit is required, returns False if not.
 
     Arguments:
-        lm: the github label maker object
+        report: the RepoReport of the repository being scanned
         repo_label: the label of the repository to be compared
         scheme_label: the label from the scheme to be compared.
 '''
-def _label_diff_check(lm, repo_label, scheme_label):
+def _label_diff_check(report, repo_label, scheme_label):
     edit_required = False
     if repo_label['description'] == scheme_label['description']:
-        print("        ├── ⚪️ The description matches, no changes")
+        report.event('description_matches', label=repo_label['name'])
     else:
         edit_required = True
-        print("        └── 🔵 The description does not match")
-        print("            ├── Scheme description:  '{0}'".format(scheme_label['description']))
-        print("            └── will overwrite:      '{0}'".format(repo_label['description']))
+        report.event('description_differs', label=repo_label['name'], scheme=scheme_label['description'], repo=repo_label['description'])
     if repo_label['color'] == scheme_label['color']:
-        print("        └── ⚪️ The color matches ({0}), no changes".format(repo_label['color']))
+        report.event('color_matches', label=repo_label['name'], repo=repo_label['color'])
     else:
         edit_required = True
-        print("        └── 🔵 The color does not match.")
-        print("            ├── Scheme color:    {0}".format(scheme_label['color']))
-        print("            └── will overwrite:  {0}".format(repo_label['color']))
+        report.event('color_differs', label=repo_label['name'], scheme=scheme_label['color'], repo=repo_label['color'])
     if not repo_label['name'] == scheme_label['name']:
         edit_required = True
     return edit_required
 
+'''
+    Plan the changes for a single repository, checking its labels against the
+    label scheme. Every check is reported as an event as it is made. Returns
+    the plan of the repository, listing the labels to add, to edit and the
+    candidates for deletion.
+
+    Arguments:
+        report: the RepoReport of the repository being scanned
+        repo_labels: the labels of the repository
+        repo: the repository to scan (an "owner" and "repository" bundle)
+        scheme_labels: the LabelScheme to apply (loaded through the JSON scheme)
+        full_name: the resolved "owner/repository" name of the repository
+'''
+def _plan_repo(report, repo_labels, repo, scheme_labels, full_name):
+    # Track matches per scan rather than on the shared scheme labels, as other
+    # repositories may be scanned against the same scheme at the same time
+    matched = set()
+    repo_plan = plan.new_repo_plan(repo, repo_labels, full_name)
+
+    for repo_label in repo_labels:
+        label_scheme_found = None
+        edit_required = False
+
+        index, scheme_label = scheme_labels.lookup(repo_label['name'])
+        if scheme_label is not None and repo_label['name'] == scheme_label['name']:
+            report.event('label_matched', label=repo_label['name'])
+            edit_required = _label_diff_check(report, repo_label, scheme_label)
+            label_scheme_found = scheme_label
+            matched.add(index)
+        elif scheme_label is not None:
+            report.event('label_aliased', label=repo_label['name'], scheme_label=scheme_label['name'])
+            edit_required = _label_diff_check(report, repo_label, scheme_label)
+            label_scheme_found = scheme_label
+            matched.add(index)
+        if label_scheme_found == None:
+            report.event('label_unmatched', label=repo_label['name'])
+            repo_plan['delete'].append(plan.label_def(repo_label))
+        elif label_scheme_found and edit_required:
+            repo_plan['edit'].append({'old': plan.label_def(repo_label), 'new': plan.label_def(label_scheme_found)})
+        else:
+            repo_plan['correct'] += 1
+
+    for index, scheme_label in enumerate(scheme_labels):
+        if index not in matched:
+            report.event('label_missing', label=scheme_label['name'], color=scheme_label['color'], description=scheme_label['description'])
+            repo_plan['add'].append(plan.label_def(scheme_label))
+    return repo_plan
+
+'''
+    Apply the plan of a single repository. Labels are edited and added, and
+    with the -d (delete) option the delete candidates are deleted; if and only
+    if they are not linked to an open Issue or Pull Request. The result of each
+    change is reported as an event; a 404 for a label that still exists means
+    the token is not allowed to change the labels. Returns the labels the
+    repository has once the changes have been made, or None if any of them
+    could not be made.
+
+    Arguments:
+        report: the RepoReport of the repository
+        lm: the GithubLabelHandler of the repository
+        repo_labels: the labels of the repository the plan was checked against
+        repo_plan: the plan of the repository
+        scheduler: the GithubRequestScheduler pacing the writes
+        args: the user provided arguments from the main thread
+'''
+def _apply_repo_plan(report, lm, repo_labels, repo_plan, scheduler, args):
+    labels = { label['name']: label for label in repo_labels }
+    failed = False
+    report.event('apply')
+    for edit in repo_plan['edit']:
+        name = edit['old']['name']
+        scheduler.pace_write()
+        try:
+            found = lm.edit_label(edit['new'], name)
+        except github.UnknownObjectException as e:
+            report.event('label_edit_denied', label=name, error=_describe_error(e))
+            failed = True
+        except Exception as e:
+            report.event('label_edit_failed', label=name, error=_describe_error(e))
+            failed = True
+        else:
+            report.event('label_edited' if found else 'label_edit_gone', label=name)
+            if found:
+                label = dict(labels.pop(name), **edit['new'])
+                labels[label['name']] = label
+            else:
+                failed = True
+    usage = {}
+    if args.delete and repo_plan['delete']:
+        # The open issues and PRs of every delete candidate are counted at once
+        try:
+            usage = lm.get_open_label_usage(repo_plan['delete'])
+        except Exception as e:
+            for repo_label in repo_plan['delete']:
+                report.event('label_delete_failed', label=repo_label['name'], error=_describe_error(e))
+            failed = True
+    if usage:
+        for repo_label in repo_plan['delete']:
+            name = repo_label['name']
+            try:
+                linked_issues = usage[name]
+                if linked_issues == 0:
+                    scheduler.pace_write()
+                found = linked_issues == 0 and lm.delete_label(name)
+            except github.UnknownObjectException as e:
+                report.event('label_delete_denied', label=name, error=_describe_error(e))
+                failed = True
+            except Exception as e:
+                report.event('label_delete_failed', label=name, error=_describe_error(e))
+                failed = True
+            else:
+                if found:
+                    report.event('label_deleted', label=name)
+                    labels.pop(name, None)
+                elif linked_issues == 0:
+                    report.event('label_delete_gone', label=name)
+                    failed = True
+                else:
+                    report.event('label_kept', label=name, open_issues=linked_issues)
+    for scheme_label in repo_plan['add']:
+        scheduler.pace_write()
+        try:
+            lm.add_label(scheme_label)
+        except github.UnknownObjectException as e:
+            # The repository was just listed, so the labels can't be created
+            report.event('label_add_denied', label=scheme_label['name'], error=_describe_error(e))
+            failed = True
+        except Exception as e:
+            report.event('label_add_failed', label=scheme_label['name'], error=_describe_error(e))
+            failed = True
+        else:
+            report.event('label_added', label=scheme_label['name'])
+            labels[scheme_label['name']] = scheme_label
+    if failed:
+        return None
+    return list(labels.values())
+
+'''
+    Apply the plan of a single repository if the rate limit budget allows for
+    all of its changes, so a run never stops halfway through a repository.
+    Returns whether the plan has been applied (False if the repository has
+    been skipped), and the labels of the repository once the changes have
+    been made (see _apply_repo_plan()), or None.
+
+    Arguments:
+        report: the RepoReport of the repository
+        lm: the GithubLabelHandler of the repository
+        repo_labels: the labels of the repository the plan was checked against
+        repo_plan: the plan of the repository
+        scheduler: the GithubRequestScheduler of the session
+        args: the user provided arguments from the main thread
+'''
+def _apply_within_budget(report, lm, repo_labels, repo_plan, scheduler, args):
+    # Counting the open issues of the labels to delete costs at most two
+    # requests per label (see GithubLabelHandler.get_open_label_usage()),
+    # usually a single one for all of them
+    cost = len(repo_plan['edit']) + len(repo_plan['add'])
+    if args.delete:
+        cost += 3 * len(repo_plan['delete'])
+    if not scheduler.acquire(cost):
+        report.event('apply_skipped')
+        return False, None
+    try:
+        return True, _apply_repo_plan(report, lm, repo_labels, repo_plan, scheduler, args)
+    finally:
+        scheduler.release(cost)
+
+'''
+    Count the changes of a repository plan, for the summary across all repos.
+
+    Arguments:
+        repo_plan: the plan of the repository
+'''
+def _count_repo_plan(repo_plan):
+    counts = dict.fromkeys(_COUNT_KEYS, 0)
+    counts['correct'] = repo_plan['correct']
+    counts['missing_from_scheme'] = len(repo_plan['delete'])
+    counts['missing_from_repo'] = len(repo_plan['add'])
+    counts['require_updates'] = len(repo_plan['edit'])
+    return counts
+
+'''
+    Scan a single repository, planning the changes against the label scheme and
+    applying them straight away with the -e (execute) option. All events are
+    buffered in the report of the repository rather than written, so that
+    concurrent scans can write each repository as one uninterrupted block.
+    Returns the report, the counts and the plan for this repository (None if
+    the scan failed, or was not needed).
+
+    With a state store, a repository whose labels haven't changed since it was
+    last found in sync with the same scheme is not checked again, and one that
+    is found in sync (or brought in sync) is recorded.
+
+    Arguments:
+        gh: the GithubAuthenticator for the session
+        reporter: the RunReporter of the run
+        repo: the repository to scan (an "owner" and "repository" bundle)
+        scheme_labels: the LabelScheme to apply (loaded through the JSON scheme)
+        scheme_fingerprint: the fingerprint of the scheme, from plan.fingerprint_scheme()
+        fetcher: the GraphqlLabelFetcher with -g (graphql), otherwise None
+        args: the user provided arguments from the main thread
+'''
+def _scan_repo(gh, reporter, repo, scheme_labels, scheme_fingerprint, fetcher, args):
+    report = reporter.new_repo(repo['owner'], repo['repository'])
+    counts = dict.fromkeys(_COUNT_KEYS, 0)
+    scheduler = gh.get_scheduler()
+    if not scheduler.acquire(SCAN_COST):
+        report.event('scan_skipped')
+        counts['skipped_repos'] += 1
+        return report, counts, None
+    try:
+        labels, open_issues = fetcher.get_labels(repo) if fetcher else (None, None)
+        lm = GithubLabelHandler(gh.get_resolver(), repo['owner'], repo['repository'], cache=gh.get_cache(), labels=labels, open_issues=open_issues, verbose=args.verbose)
+        repo_labels = lm.get_labels()
+    except Exception as e:
+        report.event('scan_failed', error=_describe_error(e))
+        counts['failed_repos'] += 1
+        return report, counts, None
+    finally:
+        scheduler.release(SCAN_COST)
+
+    state = gh.get_state()
+    fingerprint = plan.fingerprint_labels(repo_labels)
+    if state is not None and not args.full_scan and state.is_unchanged(repo['owner'], repo['repository'], scheme_fingerprint, fingerprint):
+        report.event('unchanged')
+        counts['unchanged_repos'] += 1
+        return report, counts, None
+
+    full_name = "{0}/{1}".format(gh.get_resolver().get_owner_login(repo['owner']), repo['repository'])
+    repo_plan = _plan_repo(report, repo_labels, repo, scheme_labels, full_name)
+    counts = _count_repo_plan(repo_plan)
+    if not repo_plan['add'] and not repo_plan['edit'] and not (args.delete and repo_plan['delete']):
+        synced_labels = repo_labels
+    elif args.execute:
+        applied, synced_labels = _apply_within_budget(report, lm, repo_labels, repo_plan, scheduler, args)
+        if not applied:
+            counts['skipped_repos'] += 1
+    else:
+        synced_labels = None
+    if state is not None and synced_labels is not None:
+        state.record(repo['owner'], repo['repository'], scheme_fingerprint, plan.fingerprint_labels(synced_labels))
+    return report, counts, repo_plan
+
+'''
+    Apply a saved plan to a single repository. The labels of the repository are
+    listed once to check that they have not changed since the plan was made; a
+    stale plan is not applied, and the repository needs to be planned again.
+    Returns the report and the counts for this repository.
+
+    Arguments:
+        gh: the GithubAuthenticator for the session
+        reporter: the RunReporter of the run
+        repo_plan: the saved plan of the repository
+        args: the user provided arguments from the main thread
+'''
+def _apply_saved_repo_plan(gh, reporter, repo_plan, args):
+    report = reporter.new_repo(repo_plan['owner'], repo_plan['repository'])
+    counts = dict.fromkeys(_COUNT_KEYS, 0)
+    scheduler = gh.get_scheduler()
+    if not scheduler.acquire(SCAN_COST):
+        report.event('check_skipped')
+        counts['skipped_repos'] += 1
+        return report, counts
+    # The owner the repository was found under when the plan was made, e.g.
+    # an organization discovered with -o (org) the user is not a member of
+    owner_login = repo_plan['full_name'].split('/')[0]
+    gh.get_resolver().add_org(owner_login)
+    try:
+        lm = GithubLabelHandler(gh.get_resolver(), owner_login, repo_plan['repository'], cache=gh.get_cache(), verbose=args.verbose)
+        repo_labels = lm.get_labels()
+        stale = plan.fingerprint_labels(repo_labels) != repo_plan['fingerprint']
+    except Exception as e:
+        report.event('scan_failed', error=_describe_error(e))
+        counts['failed_repos'] += 1
+        return report, counts
+    finally:
+        scheduler.release(SCAN_COST)
+
+    if stale:
+        report.event('stale')
+        counts['stale_repos'] += 1
+        return report, counts
+    counts = _count_repo_plan(repo_plan)
+    applied, _ = _apply_within_budget(report, lm, repo_labels, repo_plan, scheduler, args)
+    if not applied:
+        counts['skipped_repos'] += 1
+    return report, counts
+
+'''
+    Format an exception raised while talking to GitHub. GithubExceptions carry
+    the response data and status code, anything else is reported as is.
+
+    Arguments:
+        e: the exception to describe
+'''
+def _describe_error(e):
+    if isinstance(e, github.GithubException):
+        return "{0} [status code: {1}]".format(e.data, e.status)
+    return "{0}: {1}".format(type(e).__name__, e)
+
+'''
+    Run 'work' for each of the 'items', on -w (workers) threads at a time. The
+    items can be streamed, they are handed to the workers as they come, with
+    at most twice as many items waiting as there are workers. The report of
+    each item is flushed as a single block once its work has finished, so the
+    order may differ from the order of the items. Returns the rest of the
+    results of the work, in the order of the items, and the summed counts.
+
+    Arguments:
+        items: the repositories or repository plans to work on
+        work: the function to call for each item, returning the RepoReport
+              and the counts first
+        reporter: the RunReporter of the run
+        args: the user provided arguments from the main thread
+'''
+def _run_repos(items, work, reporter, args):
+    totals = dict.fromkeys(_COUNT_KEYS, 0)
+    results = {}
+
+    def report(position, result):
+        repo_report, counts = result[0], result[1]
+        reporter.flush(repo_report)
+        for key in _COUNT_KEYS:
+            totals[key] += counts[key]
+        results[position] = result[2:]
+
+    workers = max(1, args.workers)
+    if workers == 1:
+        for position, item in enumerate(items):
+            report(position, work(item))
+    else:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+            for position, item in enumerate(items):
+                futures[executor.submit(work, item)] = position
+                if len(futures) >= 2 * workers:
+                    done, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        report(futures.pop(future), future.result())
+            for future in concurrent.futures.as_completed(futures):
+                report(futures[future], future.result())
+    return [results[position] for position in sorted(results)], totals
+
+'''
+    The directory of the response cache of a session. Every credential has a
+    cache of its own, app installations share their login so each of them
+    gets a directory of its own under it.
+
+    Arguments:
+        gh: the GithubAuthenticator for the session
+        args: the user provided arguments from the main thread
+'''
+def get_cache_dir(gh, args):
+    credential = gh.get_credential()
+    if 'account' in credential:
+        return os.path.join(args.cache_dir, gh.get_username(), credential['account'])
+    return os.path.join(args.cache_dir, gh.get_username())
+
+'''
+    Scan the repositories of one shard, in a worker process of its own. The
+    worker has its own session for its credential, with its own rate limit
+    budget, response cache and -w (workers) threads. Repositories are read
+    from the inputs queue, as (position, repository) pairs, until None. The
+    report, counts and --state record of each repository, and once done the
+    plans, profile and connection counters of the shard, are sent to the main
+    process through the results queue; the main process is the only one
+    writing to the --state store.
+
+    Arguments:
+        shard: the index of the shard, and of its credential in the pool
+        credential: the credential of the shard, from load_credentials()
+        inputs: the queue of the repositories of the shard
+        results: the queue of the results of every shard
+        scheme_labels: the LabelScheme to apply (loaded through the JSON scheme)
+        scheme_fingerprint: the fingerprint of the scheme, from plan.fingerprint_scheme()
+        args: the user provided arguments from the main thread
+'''
+def _run_shard(shard, credential, inputs, results, scheme_labels, scheme_fingerprint, args):
+    gh = None
+    try:
+        # The connections of the main process are not shared with the worker
+        profiler = GithubRequestProfiler() if args.profile or args.profile_dump else None
+        transport = GithubTransport(args.pool_size)
+        gh = GithubAuthenticator(credential, max_retries=args.max_retries, base_url=args.base_url, profiler=profiler, transport=transport, timeout=args.timeout, request_interval=args.request_interval)
+        if not gh.is_authenticated():
+            raise Exception("Unable to authenticate with GitHub")
+        gh.set_scheduler(GithubRequestScheduler(reserve=args.rate_limit_reserve, write_interval=args.write_interval, wait=args.on_rate_limit == 'wait'))
+        gh.get_scheduler().observe()
+        if not args.no_cache:
+            gh.set_cache(GithubResponseCache(get_cache_dir(gh, args), args.cache_size * 1024 * 1024))
+        if args.state:
+            store = GithubStateStore(args.state, args.state_ttl * 3600, read_only=True)
+            gh.set_state(GithubStateForwarder(store, lambda *record: results.put(('record', shard) + record)))
+        # The discovered organizations own their repositories, like in the
+        # main process
+        for org in args.org or []:
+            gh.get_resolver().add_org(org)
+
+        positions = []
+        def stream():
+            for position, repo in iter(inputs.get, None):
+                positions.append(position)
+                yield repo
+        repositories = stream()
+        fetcher = None
+        if args.graphql:
+            fetcher = GraphqlLabelFetcher(gh, args.graphql_batch)
+            repositories = fetcher.stream(repositories)
+        reporter = ShardReporter(results, shard, quiet=args.quiet, events_path=args.events)
+
+        def work(repo):
+            # The counts are sent as soon as a repository is done, so they are
+            # not lost if the worker fails later on
+            result = _scan_repo(gh, reporter, repo, scheme_labels, scheme_fingerprint, fetcher, args)
+            results.put(('counts', shard, result[1]))
+            return result
+        shard_results, _ = _run_repos(repositories, work, reporter, args)
+        repo_plans = [(position, repo_plan) for position, (repo_plan,) in zip(positions, shard_results)]
+        results.put(('done', shard, repo_plans, profiler.get_samples() if profiler else [], transport.get_stats()))
+    except Exception as e:
+        results.put(('failed', shard, _describe_error(e)))
+    finally:
+        if gh is not None and gh.get_state() is not None:
+            gh.get_state().close()
+
+'''
+    Scan the repositories with a pool of credentials, one worker process per
+    credential. Each repository is handed to the worker of the credential
+    picked for it (see pick_credential()), as they come, and the report of
+    each repository is written as soon as a worker has sent it. A worker that
+    fails is reported, and the repositories it did not finish are counted as
+    failed. Returns the plan of every repository, in the order of the
+    repositories, and the counts summed across all the workers.
+
+    Arguments:
+        pool: the GithubAuthenticator of every credential
+        repositories: the repositories (loaded through the JSON scheme, or streamed by discover_repos_scheme)
+        scheme_labels: the LabelScheme to apply (loaded through the JSON scheme)
+        scheme_fingerprint: the fingerprint of the scheme, from plan.fingerprint_scheme()
+        reporter: the RunReporter of the run
+        args: the user provided arguments from the main thread
+'''
+def _run_shards(pool, repositories, scheme_labels, scheme_fingerprint, reporter, args):
+    # Workers are forked, they start from the schemes already loaded
+    context = multiprocessing.get_context('fork')
+    credentials = [member.get_credential() for member in pool]
+    results = context.Queue()
+    inputs = [context.Queue(2 * max(1, args.workers)) for _ in credentials]
+    processes = [
+        context.Process(target=_run_shard, args=(shard, credential, inputs[shard], results, scheme_labels, scheme_fingerprint, args), daemon=True)
+        for shard, credential in enumerate(credentials)
+    ]
+    for process in processes:
+        process.start()
+
+    totals = dict.fromkeys(_COUNT_KEYS, 0)
+    repo_plans = {}
+    sent = [0] * len(processes)
+    reported = [0] * len(processes)
+    finished = {}
+
+    def receive(timeout):
+        # Handles the next message of the workers, returns False if there was
+        # none within the timeout
+        try:
+            message = results.get(timeout=timeout) if timeout else results.get_nowait()
+        except queue.Empty:
+            return False
+        kind, shard = message[0], message[1]
+        if kind == 'report':
+            reporter.flush(message[2])
+            reported[shard] += 1
+        elif kind == 'record':
+            pool[0].get_state().record(*message[2:])
+        elif kind == 'counts':
+            for key in _COUNT_KEYS:
+                totals[key] += message[2][key]
+        elif kind == 'done':
+            shard_plans, samples, transport_stats = message[2:]
+            repo_plans.update(shard_plans)
+            if pool[0].get_profiler() is not None:
+                pool[0].get_profiler().add_samples(samples)
+            if pool[0].get_transport() is not None:
+                pool[0].get_transport().add_stats(transport_stats)
+            finished[shard] = None
+        else:
+            finished[shard] = message[2]
+        return True
+
+    def fail(repo, error):
+        report = reporter.new_repo(repo['owner'], repo['repository'])
+        report.event('scan_failed', error=error)
+        reporter.flush(report)
+        totals['failed_repos'] += 1
+
+    def send(shard, item):
+        # Waits for room in the queue of the worker, writing the reports
+        # that come in meanwhile. Returns False if the worker has stopped
+        while True:
+            if shard in finished or not processes[shard].is_alive():
+                return False
+            try:
+                inputs[shard].put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                while receive(None):
+                    pass
+
+    try:
+        count = 0
+        for repo in repositories:
+            shard = pick_credential(credentials, repo)
+            if shard is None:
+                fail(repo, "No credential of the pool has access to '{0}'".format(repo['owner']))
+            elif send(shard, (count, repo)):
+                sent[shard] += 1
+            else:
+                fail(repo, "The worker of credential {0} has stopped".format(shard + 1))
+            count += 1
+            while receive(None):
+                pass
+        for shard in range(len(processes)):
+            send(shard, None)
+
+        while len(finished) < len(processes):
+            if receive(1.0):
+                continue
+            for shard, process in enumerate(processes):
+                if shard not in finished and not process.is_alive():
+                    # Whatever the worker sent before it exited is read first
+                    while receive(0.1):
+                        pass
+                    if shard not in finished:
+                        finished[shard] = "Exited with code {0}".format(process.exitcode)
+    finally:
+        # Workers that are done exit by themselves, only the others (e.g. on
+        # a KeyboardInterrupt) are stopped
+        for shard, process in enumerate(processes):
+            if shard not in finished and process.is_alive():
+                process.terminate()
+            process.join()
+
+    for shard, error in sorted(finished.items()):
+        if error is not None:
+            print("\r\n❌ The worker of credential {0} ('{1}') failed: {2}".format(shard + 1, pool[shard].get_username(), error))
+            totals['failed_repos'] += sent[shard] - reported[shard]
+    return [(repo_plans.get(position),) for position in range(count)], totals
+
+'''
+    Print the repositories that were not (fully) worked on during the run, as
+    stale, failed or skipped for lack of rate limit budget.
+
+    Arguments:
+        totals: the summed counts of the run
+        repository_count: the number of repositories of the run
+'''
+def _print_run_problems(totals, repository_count):
+    if totals['stale_repos']:
+        print("\r\n⚠️  {0} of {1} repositories have changed since the plan was made and need to be planned again".format(totals['stale_repos'], repository_count))
+    if totals['failed_repos']:
+        print("\r\n❌ {0} of {1} repositories could not be scanned".format(totals['failed_repos'], repository_count))
+    if totals['skipped_repos']:
+        print("\r\n⏸️  {0} of {1} repositories were skipped, the rate limit budget ran out".format(totals['skipped_repos'], repository_count))
+
 '''
     Main called function which for a list of repositories, will scan through
     each checking the labels agains the label scheme to see what changes need
@@ -81,93 +701,149 @@ def _label_diff_check(lm, repo_label, scheme_label):
     scheme will be deleted from the repo; if and only if they are not linked to
     an open Issue or Pull Request.
 
+    With -p (plan), the changes planned for every repository are written to a
+    file, which can be reviewed and then applied with -a (apply) without
+    scanning the repositories again.
+
+    With -g (graphql), the labels of the repositories, and the number of open
+    issues and PRs of each label, are fetched in batches of repositories with
+    the GraphQL API instead of one repository at a time with the REST API.
+
+    With -w (workers) greater than 1, that many repositories are scanned at the
+    same time. A repository that fails is reported and counted, and does not
+    stop the others.
+
+    With a pool of more than one credential, the repositories are sharded
+    across one worker process per credential, each with its own rate limit,
+    and the results of the workers are merged.
+
     Arguments:
-        auth: the GitHub authorization object produced using glm.GithubAuthenticator()
-        repositories: a list of the repositories (loaded through the JSON scheme)
-        scheme_labels: a list of the labels to apply (loaded through the JSON scheme)
+        gh: the GithubAuthenticator for the session
+        repositories: the repositories (loaded through the JSON scheme, or streamed by discover_repos_scheme)
+        scheme_labels: the LabelScheme to apply (loaded through the JSON scheme)
         args: the user provided arguments from the main thread
+        pool: the GithubAuthenticator of every credential, or None
 '''
-def scan_repos(auth, repositories, scheme_labels, args):
-    _count_correct = 0
-    _count_missing_from_scheme = 0
-    _count_missing_from_repo = 0
-    _count_require_updates = 0
-    for repo in repositories:
-        for index, scheme_label in enumerate(scheme_labels):
-            scheme_labels[index]['repo_match'] = False
-
-        print("\r\nConnecting to repository '{0}' owned by '{1}'".format(repo['repository'], repo['owner']))
-        lm = GithubLabelHandler(auth, repo['owner'], repo['repository'], verbose=args.verbose)
-        repo_labels = lm.get_labels()
-
-        for repo_label in repo_labels:
-            # print(">> SCANNING FOR REPO LABEL {0}".format(repo_label['name']))
-            print("└── {0} (repo label)".format(repo_label['name']))
-            label_scheme_found = None
-            edit_required = False
-
-            for index, scheme_label in enumerate(scheme_labels):
-                if repo_label['name'] == scheme_label['name']:
-                    print("    └── {0} (scheme label)".format(scheme_label['name']))
-                    print("        ├── ⚪️ The name matches, no changes")
-                    edit_required = _label_diff_check(lm, repo_label, scheme_label)
-                    label_scheme_found = scheme_label
-                    scheme_labels[index]['repo_match'] = True
-                else:
-                    for scheme_alias in scheme_label['aliases']:
-                        if repo_label['name'] == scheme_alias:
-                            print("    └── {0} (alias of '{1}' scheme label)".format(scheme_alias, scheme_label['name']))
-                            print("        └── 🔵 The name doesn't match")
-                            print("            ├── Scheme name:     '{0}'".format(scheme_label['name']))
-                            print("            └── will overwrite:  '{0}'".format(repo_label['name']))
-                            edit_required = _label_diff_check(lm, repo_label, scheme_label)
-                            label_scheme_found = scheme_label
-                            scheme_labels[index]['repo_match'] = True
-                            break
-            if label_scheme_found == None:
-                _count_missing_from_scheme += 1
-                print("    └── 🔴 No scheme label or alias was found for this repo label, it will be deleted")
-                if (args.execute and args.delete):
-                    linked_issues = lm.get_issues(repo_label).totalCount
-                    if linked_issues == 0:
-                        try:
-                            lm.delete_label(repo_label['name'])
-                        except Exception as e:
-                            print("    └── ⚠️  Error deleting label: {0} [status code: {1}]".format(e.data, e.status))
-                        else:
-                            print("    └── ✅ Success: this label has been deleted")
-                    else:
-                        print("    └── ⚠️  Label not deleted, there are {0} open issues or PRs".format(linked_issues))
-            elif label_scheme_found and edit_required:
-                _count_require_updates += 1
-                if args.execute:
-                    try:
-                        lm.edit_label(label_scheme_found, repo_label['name'])
-                    except Exception as e:
-                        print("    └── ⚠️  Error updating label: {0} [status code: {1}]".format(e.data, e.status))
-                    else:
-                        print("    └── ✅ Success: this label has been updated")
-            else:
-                _count_correct += 1
-
-        for scheme_label in scheme_labels:
-            if not scheme_label['repo_match']:
-                _count_missing_from_repo += 1
-                print("└── {0}".format(scheme_label['name']))
-                print("    └── 🔵 This label was found in scheme, but not in repo, it will be created with".format(scheme_label['name']))
-                print("        ├── color:        '{0}'".format(scheme_label['color']))
-                print("        └── description:  '{0}'".format(scheme_label['description']))
-                if args.execute:
-                    try:
-                        lm.add_label(scheme_label)
-                    except Exception as e:
-                        print("    └── ❌ Error adding label: {0} [status code: {1}]".format(e.data, e.status))
-                    else:
-                        print("    └── ✅ Success: this label has been added")
+def scan_repos(gh, repositories, scheme_labels, args, pool=None):
+    scheme_fingerprint = plan.fingerprint_scheme(scheme_labels, args)
+    reporter = RunReporter(quiet=args.quiet, events_path=args.events)
+    try:
+        if pool and len(pool) > 1:
+            results, totals = _run_shards(pool, repositories, scheme_labels, scheme_fingerprint, reporter, args)
+        else:
+            fetcher = None
+            if args.graphql:
+                fetcher = GraphqlLabelFetcher(gh, args.graphql_batch)
+                repositories = fetcher.stream(repositories)
+            results, totals = _run_repos(repositories, lambda repo: _scan_repo(gh, reporter, repo, scheme_labels, scheme_fingerprint, fetcher, args), reporter, args)
+        reporter.summary(totals, len(results))
+    finally:
+        reporter.close()
 
     if not args.execute:
         print("\r\n🌐 ACROSS ALL REPOS: ")
-        print("├── ⚪️ Labels correct:      {0} (no changes)".format(_count_correct))
-        print("├── 🔴 Missing from scheme: {0} (will be deleted, if not linked issues with -e/--execute AND -d/--delete options)".format(_count_missing_from_scheme))
-        print("├── 🔵 Missing from repo:   {0} (will be added with -e/--execute option)".format(_count_missing_from_repo))
-        print("└── 🔵 Needing updates:     {0} (will be updated with -e/--execute option)".format(_count_require_updates))
\ No newline at end of file
+        print("├── ⚪️ Labels correct:      {0} (no changes)".format(totals['correct']))
+        print("├── 🔴 Missing from scheme: {0} (will be deleted, if not linked issues with -e/--execute AND -d/--delete options)".format(totals['missing_from_scheme']))
+        print("├── 🔵 Missing from repo:   {0} (will be added with -e/--execute option)".format(totals['missing_from_repo']))
+        print("└── 🔵 Needing updates:     {0} (will be updated with -e/--execute option)".format(totals['require_updates']))
+    if totals['unchanged_repos']:
+        print("\r\n⏭️  {0} of {1} repositories have not changed since they were last found in sync, they have been skipped".format(totals['unchanged_repos'], len(results)))
+    _print_run_problems(totals, len(results))
+    if args.plan:
+        repo_plans = [repo_plan for repo_plan, in results if repo_plan is not None]
+        plan.save_plan(args.plan, repo_plans, args)
+        print("\r\n📝 The plan for {0} repositories has been written to '{1}'".format(len(repo_plans), args.plan))
+
+'''
+    Apply a plan saved with -p (plan), given with the -a (apply) option. Only
+    the changes in the plan are made, the label scheme is not used. The delete
+    candidates are only deleted with the -d (delete) option.
+
+    Arguments:
+        gh: the GithubAuthenticator for the session
+        args: the user provided arguments from the main thread
+'''
+def apply_plan(gh, args):
+    print("\r\n📝 LOADING PLAN")
+    if not os.path.exists(args.apply):
+        print("└── File '{0}' does not exist".format(args.apply))
+        exit(1)
+    repo_plans = plan.load_plan(args.apply)
+    print("└── The plan for {0} repositories has been loaded from '{1}'".format(len(repo_plans), args.apply))
+
+    reporter = RunReporter(quiet=args.quiet, events_path=args.events)
+    try:
+        _, totals = _run_repos(repo_plans, lambda repo_plan: _apply_saved_repo_plan(gh, reporter, repo_plan, args), reporter, args)
+        reporter.summary(totals, len(repo_plans))
+    finally:
+        reporter.close()
+
+    _print_run_problems(totals, len(repo_plans))
+
+'''
+    Run as a daemon with the --serve option, instead of scanning a list of
+    repositories. Signed label and repository webhook events queue the
+    repository they are about, which is then reconciled on its own against the
+    label scheme, like during a scan (see _scan_repo()). The scheme and the
+    GitHub session are set up once and kept for as long as the daemon runs.
+    Events for a repository that is already queued are coalesced.
+
+    Arguments:
+        gh: the GithubAuthenticator for the session
+        scheme_labels: the LabelScheme to apply (loaded through the JSON scheme)
+        args: the user provided arguments from the main thread
+'''
+def serve(gh, scheme_labels, args):
+    host, _, port = args.listen.rpartition(':')
+    scheme_fingerprint = plan.fingerprint_scheme(scheme_labels, args)
+    reporter = RunReporter(quiet=args.quiet, events_path=args.events)
+    queue = RepoQueue(args.coalesce_delay)
+    # Only the changes of a GitHub App installation are sent by a login of
+    # its own. With a token the changes of the daemon can't be told apart
+    # from those made by hand by the owner of the token, so every event is
+    # reconciled; a repository the daemon just changed is found in sync
+    credential = gh.get_credential()
+    ignore_senders = [credential['login']] if 'login' in credential else []
+    server = WebhookServer((host or '127.0.0.1', int(port)), queue, args.webhook_secret, ignore_senders=ignore_senders, owners=args.org)
+
+    def work():
+        while True:
+            key = queue.get()
+            if key is None:
+                return
+            repo = { 'owner': key[0], 'repository': key[1] }
+            # The event names the owner of the repository, which may be an
+            # organization the user is not a member of (e.g. with an app
+            # installation, or an outside collaborator's token). It must not
+            # be resolved to a repository of the user with the same name
+            gh.get_resolver().add_org(key[0])
+            try:
+                report, _, _ = _scan_repo(gh, reporter, repo, scheme_labels, scheme_fingerprint, None, args)
+                reporter.flush(report)
+            except Exception as e:
+                print("\r\n❌ Error reconciling '{0}/{1}': {2}".format(key[0], key[1], _describe_error(e)))
+            finally:
+                queue.done(key)
+
+    workers = [threading.Thread(target=work, daemon=True) for _ in range(max(1, args.workers))]
+    for worker in workers:
+        worker.start()
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt()
+    signal.signal(signal.SIGTERM, stop)
+
+    print("\r\n📡 LISTENING FOR WEBHOOKS")
+    print("├── Listening on http://{0}:{1}/".format(*server.server_address[:2]))
+    print("├── Reconciling repositories {0}s after their last label or repository event".format(args.coalesce_delay))
+    print("└── Changes are {0}".format("made" if args.execute else "not made, this is a dry-run (use -e/--execute)"))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\r\n📡 Stopping, {0} repositories reconciled".format(queue.get_stats().get('reconciled', 0)))
+    finally:
+        server.server_close()
+        queue.close()
+        for worker in workers:
+            worker.join()
+        reporter.close()
@@ -0,0 +1,109 @@
+import json
+import hashlib
+import datetime
+
+import github_repo_sync.const as const
+
+# Format 2 plans record the full name each repository was found under
+PLAN_FORMAT = 2
+
+'''
+    Fingerprint a list of repo labels. The fingerprint only depends on the
+    name, color and description of each label, not on the order GitHub lists
+    them in, so it can be used to tell if a repo's labels changed since a plan
+    was made.
+
+    Arguments:
+        repo_labels: the labels of the repository, as returned by GithubLabelHandler.get_labels()
+'''
+def fingerprint_labels(repo_labels):
+    labels = sorted((label['name'], label['color'], label.get('description')) for label in repo_labels)
+    return hashlib.sha256(json.dumps(labels).encode('utf-8')).hexdigest()
+
+'''
+    Fingerprint the label scheme and the options that change how it is applied
+    (-i (ignore case) and -d (delete)), to tell if a repository that was in
+    sync with a scheme is still in sync with this one.
+
+    Arguments:
+        scheme_labels: the LabelScheme to apply
+        args: the user provided arguments from the main thread
+'''
+def fingerprint_scheme(scheme_labels, args):
+    scheme = {
+        'labels': list(scheme_labels),
+        'ignore_case': bool(args.ignore_case),
+        'delete': bool(args.delete)
+    }
+    return hashlib.sha256(json.dumps(scheme, sort_keys=True).encode('utf-8')).hexdigest()
+
+'''
+    Create an empty plan for a repository. A repository plan lists the labels
+    to add, the labels to edit (with their old and new values) and the labels
+    that are candidates for deletion, along with the fingerprint of the repo
+    labels it was made from. The full name is the one the repository was
+    found under (see GithubOwnerResolver), so the plan is applied to the same
+    repository whichever organizations the run that applies it knows about.
+
+    Arguments:
+        repo: the repository (an "owner" and "repository" bundle)
+        repo_labels: the labels of the repository the plan is made from
+        full_name: the resolved "owner/repository" name of the repository
+'''
+def new_repo_plan(repo, repo_labels, full_name):
+    return {
+        'owner': repo['owner'],
+        'repository': repo['repository'],
+        'full_name': full_name,
+        'fingerprint': fingerprint_labels(repo_labels),
+        'correct': 0,
+        'add': [],
+        'edit': [],
+        'delete': []
+    }
+
+'''
+    Copy the properties of a label that are needed to create or edit it, so
+    that a plan does not carry the aliases or anything else of a scheme label.
+
+    Arguments:
+        label: the scheme or repo label to copy
+'''
+def label_def(label):
+    copy = { 'name': label['name'], 'color': label['color'] }
+    if label.get('description') is not None:
+        copy['description'] = label['description']
+    return copy
+
+'''
+    Write a plan to a JSON file, so it can be reviewed and then applied later
+    with -a (apply).
+
+    Arguments:
+        path: the file to write the plan to
+        repo_plans: the list of repository plans
+        args: the user provided arguments from the main thread
+'''
+def save_plan(path, repo_plans, args):
+    plan = {
+        'format': PLAN_FORMAT,
+        'version': const.VERSION,
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'labels': args.labels,
+        'repositories': repo_plans
+    }
+    with open(path, 'w') as file:
+        json.dump(plan, file, indent=4)
+
+'''
+    Read a plan written by save_plan(). Returns the list of repository plans.
+
+    Arguments:
+        path: the file to read the plan from
+'''
+def load_plan(path):
+    with open(path, 'r') as file:
+        plan = json.load(file)
+    if plan.get('format') != PLAN_FORMAT:
+        raise ValueError("'{0}' is not a plan made by this version of github_repo_sync".format(path))
+    return plan['repositories']
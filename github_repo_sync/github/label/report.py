@@ -0,0 +1,148 @@
+import sys
+import json
+import threading
+
+# The tree lines of each event, formatted with the fields of the event
+_TREE_LINES = {
+    'repo': ["\r\nConnecting to repository '{repository}' owned by '{owner}'"],
+    'scan_skipped': ["└── ⏸️  Skipped, there is not enough rate limit budget left to scan it"],
+    'check_skipped': ["└── ⏸️  Skipped, there is not enough rate limit budget left to check it"],
+    'scan_failed': ["└── ❌ Error scanning repository: {error}"],
+    'unchanged': ["└── ⏭️  Unchanged since it was last found in sync with this scheme, skipped"],
+    'stale': ["└── ⚠️  The labels of this repository have changed since the plan was made, it has been skipped"],
+    'label_matched': [
+        "└── {label} (repo label)",
+        "    └── {label} (scheme label)",
+        "        ├── ⚪️ The name matches, no changes"],
+    'label_aliased': [
+        "└── {label} (repo label)",
+        "    └── {label} (alias of '{scheme_label}' scheme label)",
+        "        └── 🔵 The name doesn't match",
+        "            ├── Scheme name:     '{scheme_label}'",
+        "            └── will overwrite:  '{label}'"],
+    'description_matches': ["        ├── ⚪️ The description matches, no changes"],
+    'description_differs': [
+        "        └── 🔵 The description does not match",
+        "            ├── Scheme description:  '{scheme}'",
+        "            └── will overwrite:      '{repo}'"],
+    'color_matches': ["        └── ⚪️ The color matches ({repo}), no changes"],
+    'color_differs': [
+        "        └── 🔵 The color does not match.",
+        "            ├── Scheme color:    {scheme}",
+        "            └── will overwrite:  {repo}"],
+    'label_unmatched': [
+        "└── {label} (repo label)",
+        "    └── 🔴 No scheme label or alias was found for this repo label, it will be deleted"],
+    'label_missing': [
+        "└── {label}",
+        "    └── 🔵 This label was found in scheme, but not in repo, it will be created with",
+        "        ├── color:        '{color}'",
+        "        └── description:  '{description}'"],
+    'apply_skipped': ["└── ⏸️  Skipped, there is not enough rate limit budget left to apply the changes"],
+    'apply': ["└── Applying changes"],
+    'label_edited': ["    └── {label}", "        └── ✅ Success: this label has been updated"],
+    'label_edit_gone': ["    └── {label}", "        └── ⚠️  Label not updated, it has been renamed or deleted since it was listed"],
+    'label_edit_failed': ["    └── {label}", "        └── ⚠️  Error updating label: {error}"],
+    'label_edit_denied': ["    └── {label}", "        └── ⚠️  Label not updated, the token can read the labels of this repository but not change them: {error}"],
+    'label_deleted': ["    └── {label}", "        └── ✅ Success: this label has been deleted"],
+    'label_delete_gone': ["    └── {label}", "        └── ⚠️  Label not deleted, it has been renamed or deleted since it was listed"],
+    'label_kept': ["    └── {label}", "        └── ⚠️  Label not deleted, there are {open_issues} open issues or PRs"],
+    'label_delete_failed': ["    └── {label}", "        └── ⚠️  Error deleting label: {error}"],
+    'label_delete_denied': ["    └── {label}", "        └── ⚠️  Label not deleted, the token can read the labels of this repository but not change them: {error}"],
+    'label_added': ["    └── {label}", "        └── ✅ Success: this label has been added"],
+    'label_add_failed': ["    └── {label}", "        └── ❌ Error adding label: {error}"],
+    'label_add_denied': ["    └── {label}", "        └── ❌ Label not added, the token can read the labels of this repository but not change them: {error}"],
+}
+
+# Events that are still shown with -q (quiet), along with the repository
+_PROBLEM_EVENTS = frozenset([
+    'scan_skipped', 'check_skipped', 'scan_failed', 'stale', 'apply_skipped',
+    'label_edit_failed', 'label_delete_failed', 'label_add_failed',
+    'label_edit_denied', 'label_delete_denied', 'label_add_denied'
+])
+
+def _get_keep(quiet, events_path):
+    # The events worth recording, None for all of them. Quiet runs without an
+    # events file only ever show the problems
+    if quiet and not events_path:
+        return _PROBLEM_EVENTS | set(['repo'])
+    return None
+
+class RepoReport:
+    def __init__(self, owner, repository, keep=None):
+        # Buffers the events of one repository, so they are written as one
+        # block once the repository is done. With keep, only those events
+        # are recorded and every other one is dropped straight away
+        self.owner = owner
+        self.repository = repository
+        self.events = []
+        self._keep = keep
+        self.event('repo')
+
+    def event(self, kind, **fields):
+        if self._keep is not None and kind not in self._keep:
+            return
+        event = { 'event': kind, 'owner': self.owner, 'repository': self.repository }
+        event.update(fields)
+        self.events.append(event)
+
+class RunReporter:
+    def __init__(self, quiet=False, events_path=None):
+        # Writes the events of every repository as JSONL to events_path, and
+        # renders them as a tree on stdout unless quiet. Only the main thread
+        # writes, workers hand over their RepoReport once they are done
+        self._quiet = quiet
+        self._keep = _get_keep(quiet, events_path)
+        self._events_file = open(events_path, 'w') if events_path else None
+        self._lock = threading.Lock()
+
+    def new_repo(self, owner, repository):
+        return RepoReport(owner, repository, self._keep)
+
+    def flush(self, report):
+        with self._lock:
+            if self._events_file is not None:
+                for event in report.events:
+                    self._write_event(event)
+                self._events_file.flush()
+            events = report.events
+            if self._quiet:
+                events = [event for event in events if event['event'] in _PROBLEM_EVENTS]
+                if not events:
+                    return
+                events = report.events[:1] + events
+            lines = []
+            for event in events:
+                lines.extend(line.format(**event) for line in _TREE_LINES[event['event']])
+            sys.stdout.write("\n".join(lines) + "\n")
+            sys.stdout.flush()
+
+    def summary(self, totals, repository_count):
+        with self._lock:
+            if self._events_file is not None:
+                event = { 'event': 'summary', 'repositories': repository_count }
+                event.update(totals)
+                self._write_event(event)
+
+    def close(self):
+        sys.stdout.flush()
+        if self._events_file is not None:
+            self._events_file.close()
+
+    def _write_event(self, event):
+        self._events_file.write(json.dumps(event) + "\n")
+
+class ShardReporter:
+    def __init__(self, results, shard, quiet=False, events_path=None):
+        # Stands in for the RunReporter in a worker process. The RepoReport of
+        # each repository is handed over to the main process through the
+        # results queue, and written there
+        self._keep = _get_keep(quiet, events_path)
+        self._results = results
+        self._shard = shard
+
+    def new_repo(self, owner, repository):
+        return RepoReport(owner, repository, self._keep)
+
+    def flush(self, report):
+        self._results.put(('report', self._shard, report))
@@ -0,0 +1,44 @@
+class LabelScheme:
+    def __init__(self, labels, ignore_case=False):
+        assert isinstance(labels, list)
+        self.labels = labels
+        self._ignore_case = ignore_case
+        self._index = {}
+        self.collisions = []
+        # Names are indexed before aliases, so a label name always wins over
+        # another label's alias
+        for position, label in enumerate(labels):
+            self._add(label['name'], position)
+        for position, label in enumerate(labels):
+            for alias in label.get('aliases', []):
+                self._add(alias, position)
+
+    def __iter__(self):
+        return iter(self.labels)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def _normalize(self, name):
+        name = name.strip()
+        if self._ignore_case:
+            return name.casefold()
+        return name
+
+    def _add(self, name, position):
+        key = self._normalize(name)
+        if key in self._index:
+            existing = self._index[key]
+            # An alias repeating its own label's name is harmless
+            if existing != position:
+                self.collisions.append((name, self.labels[position]['name'], self.labels[existing]['name']))
+            return
+        self._index[key] = position
+
+    def lookup(self, name):
+        # Returns the position and scheme label matching the given repo label
+        # name, by name or by alias, or (None, None) if there is no match
+        position = self._index.get(self._normalize(name))
+        if position is None:
+            return None, None
+        return position, self.labels[position]
@@ -0,0 +1,67 @@
+import re
+import logging
+import urllib.parse
+
+'''
+    Page through a listing of the GitHub REST API, yielding the items of each
+    page along with the url of the next page (None on the last page). Pages
+    that are in the cache are requested with their ETag, GitHub answers with an
+    empty 304 if the page hasn't changed, which doesn't count against the rate
+    limit. Pages are only requested as they are consumed.
+
+    GitHub's ETag only covers the items of a page, not its Link header, so an
+    unchanged full last page doesn't tell whether a page was added after it;
+    the page after a full cached page is always requested.
+
+    Arguments:
+        requester: the PyGithub requester to send the requests with
+        url: the url of the first page
+        cache: the GithubResponseCache of the session, or None
+'''
+def iter_pages(requester, url, cache=None):
+    while url:
+        cached = cache.get(url) if cache else None
+        headers = { "If-None-Match": cached['etag'] } if cached else {}
+        response_headers, data = requester.requestJsonAndCheck("GET", url, headers=headers)
+        if data is None and cached:
+            logging.info("'{0}' has not changed since it was cached".format(url))
+            data, next_url = cached['data'], cached['next']
+            if next_url is None and len(data) >= _get_per_page(requester, url):
+                next_url = _following_page_url(url)
+        else:
+            next_url = _next_page_url(response_headers)
+            if cache:
+                cache.put(url, response_headers.get('etag'), data, next_url)
+        yield data, next_url
+        url = next_url
+
+'''
+    Page through a listing of the GitHub REST API, yielding each item. See
+    iter_pages().
+
+    Arguments:
+        requester: the PyGithub requester to send the requests with
+        url: the url of the first page
+        cache: the GithubResponseCache of the session, or None
+'''
+def get_pages(requester, url, cache=None):
+    for data, _ in iter_pages(requester, url, cache):
+        for item in data:
+            yield item
+
+def _next_page_url(response_headers):
+    for link in response_headers.get('link', '').split(','):
+        match = re.match(r'\s*<([^>]+)>;\s*rel="next"', link)
+        if match:
+            return match.group(1)
+    return None
+
+def _get_per_page(requester, url):
+    query = urllib.parse.parse_qs(urllib.parse.urlsplit(url).query)
+    return int(query['per_page'][0]) if 'per_page' in query else requester.per_page
+
+def _following_page_url(url):
+    parts = urllib.parse.urlsplit(url)
+    query = urllib.parse.parse_qs(parts.query)
+    query['page'] = [str(int(query.get('page', ['1'])[0]) + 1)]
+    return urllib.parse.urlunsplit(parts._replace(query=urllib.parse.urlencode(query, doseq=True)))
@@ -0,0 +1,173 @@
+import re
+import json
+import time
+import threading
+import urllib.parse
+
+# Endpoint templates, matched against the end of the request path so a base
+# URL path (e.g. "/api/v3" on GitHub Enterprise Server) doesn't matter. The
+# first match wins
+_ENDPOINTS = [
+    (re.compile(r'/repos/[^/]+/[^/]+/labels/[^/]+$'), '/repos/:owner/:repo/labels/:name'),
+    (re.compile(r'/repos/[^/]+/[^/]+/labels$'), '/repos/:owner/:repo/labels'),
+    (re.compile(r'/repos/[^/]+/[^/]+/issues$'), '/repos/:owner/:repo/issues'),
+    (re.compile(r'/repos/[^/]+/[^/]+$'), '/repos/:owner/:repo'),
+    (re.compile(r'/orgs/[^/]+/repos$'), '/orgs/:org/repos'),
+    (re.compile(r'/orgs/[^/]+$'), '/orgs/:org'),
+    (re.compile(r'/users/[^/]+$'), '/users/:user'),
+    (re.compile(r'/user/orgs$'), '/user/orgs'),
+    (re.compile(r'/user$'), '/user'),
+    (re.compile(r'/rate_limit$'), '/rate_limit'),
+    (re.compile(r'/graphql$'), '/graphql'),
+]
+
+# The phase of the run each endpoint belongs to, for the latency histograms
+_PHASES = {
+    ('GET', '/user'): 'authentication',
+    ('GET', '/rate_limit'): 'authentication',
+    ('GET', '/user/orgs'): 'owner lookups',
+    ('GET', '/orgs/:org'): 'owner lookups',
+    ('GET', '/users/:user'): 'owner lookups',
+    ('GET', '/repos/:owner/:repo'): 'owner lookups',
+    ('GET', '/orgs/:org/repos'): 'repository discovery',
+    ('GET', '/repos/:owner/:repo/labels'): 'label listings',
+    ('POST', '/graphql'): 'label listings',
+    ('GET', '/repos/:owner/:repo/labels/:name'): 'label lookups',
+    ('GET', '/repos/:owner/:repo/issues'): 'open issue counts',
+    ('POST', '/repos/:owner/:repo/labels'): 'label changes',
+    ('PATCH', '/repos/:owner/:repo/labels/:name'): 'label changes',
+    ('DELETE', '/repos/:owner/:repo/labels/:name'): 'label changes',
+}
+
+# Upper bounds of the histogram buckets, in milliseconds
+_BUCKETS = [10, 25, 50, 100, 250, 500, 1000, 2500, None]
+_BAR_WIDTH = 30
+
+'''
+    Return the endpoint template of a request path, e.g.
+    "/repos/:owner/:repo/labels" for "/repos/acme/api/labels?page=2".
+
+    Arguments:
+        url: the path (and query) of the request
+'''
+def endpoint_template(url):
+    path = urllib.parse.unquote(urllib.parse.urlsplit(url).path).rstrip('/')
+    for pattern, template in _ENDPOINTS:
+        if pattern.search(path):
+            return template
+    return path or '/'
+
+def _percentile(values, fraction):
+    # values must be sorted
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+class GithubRequestProfiler:
+    def __init__(self):
+        # One sample is recorded per HTTP call made by any PyGithub client of
+        # the process, retries included, once its connection classes are used
+        self._samples = []
+        self._lock = threading.Lock()
+        self._started = time.time()
+
+    def get_connection_classes(self, bases):
+        # PyGithub creates its connections from the connection classes of the
+        # Requester, which are replaced by subclasses of 'bases' (the http and
+        # https classes) timing every response
+        profiler = self
+        classes = []
+        for base in bases:
+            classes.append(type('Profiled' + base.__name__, (base,), {
+                'getresponse': lambda connection, base=base: profiler._profile(connection, base)
+            }))
+        return tuple(classes)
+
+    def _profile(self, connection, base):
+        start = time.perf_counter()
+        status = None
+        size = 0
+        headers = {}
+        try:
+            response = base.getresponse(connection)
+            status = response.status
+            headers = response.headers
+            size = int(headers.get('Content-Length') or (0 if connection.stream else len(response.response.content)))
+            return response
+        finally:
+            self.record(connection.verb, connection.url, status, time.perf_counter() - start, size, headers)
+
+    def record(self, verb, url, status, seconds, size, headers):
+        endpoint = endpoint_template(url)
+        # Conditional requests answered with 304 Not Modified are free
+        cost = 0 if status == 304 or status is None else 1
+        sample = {
+            'time': round(time.time() - self._started, 4),
+            'verb': verb,
+            'endpoint': endpoint,
+            'phase': _PHASES.get((verb, endpoint), 'other'),
+            'status': status,
+            'ms': round(seconds * 1000, 2),
+            'bytes': size,
+            'cost': cost,
+            'resource': headers.get('X-RateLimit-Resource', 'core') if cost else None,
+            'remaining': headers.get('X-RateLimit-Remaining')
+        }
+        with self._lock:
+            self._samples.append(sample)
+
+    def add_samples(self, samples):
+        # Samples recorded by the profiler of another process, e.g. a worker
+        with self._lock:
+            self._samples.extend(samples)
+
+    def get_samples(self):
+        with self._lock:
+            return list(self._samples)
+
+    def dump(self, path):
+        # Raw timings, one JSON object per request
+        with open(path, 'w') as file:
+            for sample in self.get_samples():
+                file.write(json.dumps(sample) + "\n")
+
+    def print_summary(self):
+        samples = self.get_samples()
+        print("\r\n⏱️  PROFILE: {0} requests".format(len(samples)))
+        if not samples:
+            return
+        groups = {}
+        for sample in samples:
+            groups.setdefault((sample['verb'], sample['endpoint']), []).append(sample)
+        print("{0:<48} {1:>7} {2:>6} {3:>9} {4:>8} {5:>8} {6:>8} {7:>10} {8:>6}".format(
+            'endpoint', 'calls', 'errors', 'total s', 'p50 ms', 'p95 ms', 'max ms', 'KB', 'cost'))
+        for (verb, endpoint), group in sorted(groups.items(), key=lambda item: -sum(sample['ms'] for sample in item[1])):
+            latencies = sorted(sample['ms'] for sample in group)
+            print("{0:<48} {1:>7} {2:>6} {3:>9.2f} {4:>8.1f} {5:>8.1f} {6:>8.1f} {7:>10.1f} {8:>6}".format(
+                "{0} {1}".format(verb, endpoint),
+                len(group),
+                len([sample for sample in group if sample['status'] is None or sample['status'] >= 400]),
+                sum(latencies) / 1000,
+                _percentile(latencies, 0.5),
+                _percentile(latencies, 0.95),
+                latencies[-1],
+                sum(sample['bytes'] for sample in group) / 1024.0,
+                sum(sample['cost'] for sample in group)))
+
+        phases = {}
+        for sample in samples:
+            phases.setdefault(sample['phase'], []).append(sample['ms'])
+        for phase, latencies in sorted(phases.items(), key=lambda item: -sum(item[1])):
+            print("\r\n{0}: {1} requests, {2:.2f}s".format(phase, len(latencies), sum(latencies) / 1000))
+            counts = [0] * len(_BUCKETS)
+            for latency in latencies:
+                for index, bound in enumerate(_BUCKETS):
+                    if bound is None or latency < bound:
+                        counts[index] += 1
+                        break
+            # Only the buckets from the fastest to the slowest request are shown
+            used = [index for index, count in enumerate(counts) if count]
+            for index in range(used[0], used[-1] + 1):
+                bound = _BUCKETS[index]
+                branch = "└──" if index == used[-1] else "├──"
+                label = "< {0} ms".format(bound) if bound else ">= {0} ms".format(_BUCKETS[-2])
+                bar = "█" * int(round(_BAR_WIDTH * counts[index] / float(len(latencies))))
+                print("{0} {1:>10} {2:<{3}} {4}".format(branch, label, bar, _BAR_WIDTH, counts[index]))
@@ -0,0 +1,35 @@
+import logging
+import threading
+
+class GithubOwnerResolver:
+    def __init__(self, gh):
+        self._gh = gh
+        self._orgs = None
+        self._known_orgs = set()
+        self._lock = threading.Lock()
+
+    def _get_orgs(self):
+        # The user's organizations are the same for the whole session, so they
+        # are only fetched (and paginated through) once
+        with self._lock:
+            if self._orgs is None:
+                self._orgs = set(org.login for org in self._gh.get_auth().get_user().get_orgs())
+                logging.info("resolved {0} organizations for '{1}'".format(len(self._orgs), self._gh.get_username()))
+            return self._orgs
+
+    def add_org(self, github_org_name):
+        # Organizations whose repositories have been discovered are known to
+        # own them, whether or not the user is one of their members
+        with self._lock:
+            self._known_orgs.add(github_org_name)
+
+    def get_owner_login(self, github_owner_name):
+        # Repository either owned by user or one of user's organization
+        if github_owner_name in self._known_orgs or github_owner_name in self._get_orgs():
+            return github_owner_name
+        return self._gh.get_username()
+
+    def get_repo(self, github_owner_name, github_repo_name):
+        # The handle is lazy, nothing is requested until the repository is used
+        full_name = "{0}/{1}".format(self.get_owner_login(github_owner_name), github_repo_name)
+        return self._gh.get_auth().get_repo(full_name, lazy=True)
@@ -0,0 +1,109 @@
+import time
+import logging
+import threading
+
+# Estimated requests needed to list the labels of a repository, before we
+# know how many labels it has
+SCAN_COST = 2
+
+# The core rate limit in the headers of the last core response received by
+# each thread. Responses of the other resources, e.g. "graphql" or "search",
+# carry limits of their own, which PyGithub keeps in the same rate_limiting of
+# the client, so it can't be relied on
+_core_rate_limit = threading.local()
+
+'''
+    Return subclasses of the connection classes 'bases' (the http and https
+    classes) recording the core rate limit (X-RateLimit-Resource) of every
+    response, for GithubRequestScheduler.observe().
+
+    Arguments:
+        bases: the connection classes to extend
+'''
+def get_scheduler_connection_classes(bases):
+    classes = []
+    for base in bases:
+        def getresponse(connection, base=base):
+            response = base.getresponse(connection)
+            headers = response.headers
+            if headers.get('X-RateLimit-Resource', 'core') == 'core' and 'X-RateLimit-Remaining' in headers:
+                _core_rate_limit.remaining = int(float(headers['X-RateLimit-Remaining']))
+                _core_rate_limit.reset = int(float(headers.get('X-RateLimit-Reset', 0)))
+            return response
+        classes.append(type('Scheduled' + base.__name__, (base,), { 'getresponse': getresponse }))
+    return tuple(classes)
+
+class GithubRequestScheduler:
+    def __init__(self, reserve=100, write_interval=1.0, wait=True):
+        # reserve is the part of the core rate limit that is never spent, so
+        # the token can still be used while (or right after) the run finishes
+        self._reserve = reserve
+        self._write_interval = write_interval
+        self._wait = wait
+        self._remaining = None
+        self._reset = 0
+        self._pending = 0
+        self._last_write = 0
+        self._exhausted = False
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def observe(self):
+        # Every thread sees the remaining core rate limit in the headers of
+        # its own responses. They all share one token, so the lowest value
+        # seen since the last reset is the most up to date
+        remaining = getattr(_core_rate_limit, 'remaining', None)
+        reset = getattr(_core_rate_limit, 'reset', 0)
+        if remaining is None:
+            return
+        with self._lock:
+            if reset > self._reset or self._remaining is None:
+                self._remaining, self._reset = remaining, reset
+            elif reset == self._reset:
+                self._remaining = min(self._remaining, remaining)
+
+    def get_remaining(self):
+        with self._lock:
+            return self._remaining
+
+    def is_exhausted(self):
+        return self._exhausted
+
+    def acquire(self, cost):
+        # Reserves the budget for 'cost' requests before a repository is
+        # scanned or changed. Returns False, and stops every later acquire,
+        # if the budget is not enough and we don't wait for the reset
+        while True:
+            with self._lock:
+                if self._exhausted:
+                    return False
+                if self._remaining is None or self._reset < time.time():
+                    # Unknown, or a new rate limit window since we last looked
+                    self._pending += cost
+                    return True
+                if self._remaining - self._pending - cost >= self._reserve:
+                    self._pending += cost
+                    return True
+                if not self._wait:
+                    self._exhausted = True
+                    logging.warning("rate limit budget exhausted: {0} remaining, {1} needed".format(self._remaining, cost))
+                    return False
+                delay = self._reset - time.time() + 1
+            logging.warning("rate limit budget exhausted, waiting {0:.0f}s for the reset".format(delay))
+            time.sleep(max(delay, 1))
+
+    def release(self, cost):
+        # Called once the reserved requests have been made, the rate limit
+        # headers of their responses now account for them
+        self.observe()
+        with self._lock:
+            self._pending = max(0, self._pending - cost)
+
+    def pace_write(self):
+        # Writes are spread by at least write_interval seconds across all the
+        # workers, to stay under GitHub's secondary rate limits
+        with self._write_lock:
+            delay = self._last_write + self._write_interval - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            self._last_write = time.time()
@@ -0,0 +1,79 @@
+import os
+import time
+import sqlite3
+import threading
+
+# Records are committed in batches rather than one by one
+_COMMIT_EVERY = 50
+
+class GithubStateStore:
+    def __init__(self, path, ttl, read_only=False):
+        # Records, per repository, the hash of the label scheme and options it
+        # was last found in sync with, and the fingerprint of its labels at the
+        # time. ttl is in seconds, a record older than that is not trusted and
+        # the repository is fully checked again. A read_only store only checks
+        # the records of a store opened by another process
+        self._ttl = ttl
+        self._pending = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory and not read_only:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        if read_only:
+            return
+        # Readers in other processes are never blocked by the pending records
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS repositories ("
+            "owner TEXT NOT NULL, "
+            "repository TEXT NOT NULL, "
+            "scheme TEXT NOT NULL, "
+            "fingerprint TEXT NOT NULL, "
+            "checked REAL NOT NULL, "
+            "PRIMARY KEY (owner, repository))")
+        self._db.commit()
+
+    def is_unchanged(self, owner, repository, scheme, fingerprint):
+        # True if the repository was found in sync with the same scheme and the
+        # same labels, less than ttl seconds ago
+        with self._lock:
+            row = self._db.execute(
+                "SELECT scheme, fingerprint, checked FROM repositories WHERE owner = ? AND repository = ?",
+                (owner, repository)).fetchone()
+        if row is None:
+            return False
+        return row[0] == scheme and row[1] == fingerprint and time.time() - row[2] < self._ttl
+
+    def record(self, owner, repository, scheme, fingerprint):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO repositories (owner, repository, scheme, fingerprint, checked) VALUES (?, ?, ?, ?, ?)",
+                (owner, repository, scheme, fingerprint, time.time()))
+            self._pending += 1
+            if self._pending >= _COMMIT_EVERY:
+                self._db.commit()
+                self._pending = 0
+
+    def close(self):
+        with self._lock:
+            self._db.commit()
+            self._db.close()
+
+class GithubStateForwarder:
+    def __init__(self, store, forward):
+        # Stands in for the GithubStateStore in a worker process. Repositories
+        # are checked against the (read only) store, but records are handed to
+        # forward(owner, repository, scheme, fingerprint), so the main process
+        # is the only one writing to the store
+        self._store = store
+        self._forward = forward
+
+    def is_unchanged(self, owner, repository, scheme, fingerprint):
+        return self._store.is_unchanged(owner, repository, scheme, fingerprint)
+
+    def record(self, owner, repository, scheme, fingerprint):
+        self._forward(owner, repository, scheme, fingerprint)
+
+    def close(self):
+        self._store.close()
@@ -0,0 +1,82 @@
+import threading
+import requests
+import requests.adapters
+
+import github.Requester
+
+class GithubTransport:
+    def __init__(self, pool_size=10):
+        # One requests session, with one pool of keep-alive connections per
+        # host, shared by every PyGithub client of the process. Without it each
+        # client (one per worker thread) opens connections of its own, and a
+        # new one for every request once the connection classes are replaced.
+        # pool_size is the number of connections kept open to each host, it
+        # should match the number of requests made at the same time
+        self._pool_size = pool_size
+        self._session = None
+        self._adapter = None
+        self._merged = { 'requests': 0, 'connections': 0 }
+        self._lock = threading.Lock()
+
+    def get_session(self, retry):
+        # The session is created by the first connection, with the retry
+        # policy of the clients, which is the same for all of them
+        with self._lock:
+            if self._session is None:
+                self._adapter = requests.adapters.HTTPAdapter(max_retries=retry, pool_connections=4, pool_maxsize=self._pool_size)
+                self._session = requests.Session()
+                # Same as PyGithub, so a .netrc file doesn't override the token
+                self._session.auth = github.Requester.Requester.noopAuth
+                self._session.headers['Accept-Encoding'] = 'gzip'
+                self._session.mount('http://', self._adapter)
+                self._session.mount('https://', self._adapter)
+            return self._session
+
+    def get_connection_classes(self):
+        # PyGithub creates its connections from these classes. They send the
+        # requests through the shared session, and closing them leaves the
+        # pooled connections open for the next requests
+        transport = self
+        classes = []
+        for base in (github.Requester.HTTPRequestsConnectionClass, github.Requester.HTTPSRequestsConnectionClass):
+            def __init__(connection, host, port=None, strict=False, timeout=None, retry=None, pool_size=None, base=base, **kwargs):
+                connection.port = port if port else (443 if base is github.Requester.HTTPSRequestsConnectionClass else 80)
+                connection.host = host
+                connection.protocol = 'https' if base is github.Requester.HTTPSRequestsConnectionClass else 'http'
+                connection.timeout = timeout
+                connection.verify = kwargs.get('verify', True)
+                connection.session = transport.get_session(retry)
+            classes.append(type('Pooled' + base.__name__, (base,), {
+                '__init__': __init__,
+                'close': lambda connection: None
+            }))
+        return tuple(classes)
+
+    def add_stats(self, stats):
+        # Counters of the transport of another process, e.g. a worker
+        with self._lock:
+            for key in self._merged:
+                self._merged[key] += stats[key]
+
+    def get_stats(self):
+        # Counters of the connection pools: the requests sent, and the
+        # connections opened to send them
+        with self._lock:
+            stats = dict(self._merged, pool_size=self._pool_size)
+            if self._adapter is None:
+                return stats
+            pools = [self._adapter.poolmanager.pools[key] for key in self._adapter.poolmanager.pools.keys()]
+        for pool in pools:
+            stats['requests'] += pool.num_requests
+            stats['connections'] += pool.num_connections
+        return stats
+
+    def print_stats(self):
+        stats = self.get_stats()
+        print("\r\n🔌 CONNECTIONS: {0} requests over {1} connections, {2} connections kept open per host".format(
+            stats['requests'], stats['connections'], stats['pool_size']))
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
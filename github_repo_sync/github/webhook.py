@@ -0,0 +1,209 @@
+import sys
+import hmac
+import json
+import time
+import hashlib
+import logging
+import argparse
+import threading
+import collections
+import http.server
+import urllib.error
+import urllib.request
+
+# The webhook events that can leave a repository out of sync with the label
+# scheme, and the actions of each that do (None for all of them)
+_EVENT_ACTIONS = {
+    'label': None,
+    'repository': frozenset(['created', 'renamed', 'transferred', 'unarchived'])
+}
+
+'''
+    Sign a webhook payload the way GitHub does, for the X-Hub-Signature-256
+    header.
+
+    Arguments:
+        secret: the secret of the webhook
+        body: the payload, as bytes
+'''
+def sign_payload(secret, body):
+    return 'sha256=' + hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+
+'''
+    Check the X-Hub-Signature-256 header of a webhook delivery against the
+    payload. Returns False if the signature is missing or doesn't match.
+
+    Arguments:
+        secret: the secret of the webhook
+        body: the payload, as bytes
+        signature: the value of the X-Hub-Signature-256 header
+'''
+def verify_signature(secret, body, signature):
+    if not signature:
+        return False
+    return hmac.compare_digest(sign_payload(secret, body), signature)
+
+class RepoQueue:
+    def __init__(self, delay):
+        # Repositories wait 'delay' seconds after their last event before they
+        # are handed out, so a burst of events (e.g. a dozen labels edited by
+        # hand) ends up as a single reconcile. A repository is never handed out
+        # twice at the same time; events received while it is being worked on
+        # queue it again once the work is done
+        self._delay = delay
+        self._due = {}
+        self._active = set()
+        self._dirty = set()
+        self._closed = False
+        self._condition = threading.Condition()
+        self._stats = collections.Counter()
+
+    def put(self, owner, repository):
+        key = (owner, repository)
+        with self._condition:
+            self._stats['events'] += 1
+            if key in self._due or key in self._dirty:
+                self._stats['coalesced'] += 1
+            if key in self._active:
+                self._dirty.add(key)
+            else:
+                self._due[key] = time.time() + self._delay
+            self._condition.notify()
+
+    def get(self):
+        # Blocks until a repository is due, returns its (owner, repository) or
+        # None once the queue has been closed
+        with self._condition:
+            while not self._closed:
+                timeout = None
+                if self._due:
+                    key = min(self._due, key=self._due.get)
+                    timeout = self._due[key] - time.time()
+                    if timeout <= 0:
+                        del self._due[key]
+                        self._active.add(key)
+                        return key
+                self._condition.wait(timeout)
+            return None
+
+    def done(self, key):
+        with self._condition:
+            self._active.discard(key)
+            self._stats['reconciled'] += 1
+            if key in self._dirty:
+                self._dirty.discard(key)
+                self._due[key] = time.time() + self._delay
+            self._condition.notify_all()
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def get_stats(self):
+        with self._condition:
+            stats = dict(self._stats)
+            stats['pending'] = len(self._due) + len(self._dirty)
+            stats['active'] = len(self._active)
+            return stats
+
+class WebhookHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        logging.info("webhook: " + format % args)
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        # Health check, with the counters of the queue
+        self._send(200, self.server.queue.get_stats())
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if not verify_signature(self.server.secret, body, self.headers.get('X-Hub-Signature-256')):
+            return self._send(401, { 'message': 'Invalid signature' })
+        event = self.headers.get('X-GitHub-Event', '')
+        if event == 'ping':
+            return self._send(200, { 'message': 'pong' })
+        try:
+            payload = json.loads(body)
+            owner = payload['repository']['owner']['login']
+            repository = payload['repository']['name']
+        except (ValueError, KeyError, TypeError):
+            return self._send(400, { 'message': 'Not a repository event' })
+
+        reason = self.server.ignore_reason(event, payload, owner)
+        if reason:
+            logging.info("ignoring {0} event for '{1}/{2}': {3}".format(event, owner, repository, reason))
+            return self._send(202, { 'message': 'Ignored, ' + reason })
+        self.server.queue.put(owner, repository)
+        logging.info("queued '{0}/{1}' after a {2} event".format(owner, repository, event))
+        self._send(202, { 'message': 'Queued', 'repository': '{0}/{1}'.format(owner, repository) })
+
+class WebhookServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, queue, secret, ignore_senders=(), owners=None):
+        # Events sent by one of ignore_senders (the bot of an app installation)
+        # are ignored, so the changes made by the daemon itself don't queue
+        # the repository again. With owners,
+        # only the repositories of those owners are queued
+        super().__init__(address, WebhookHandler)
+        self.queue = queue
+        self.secret = secret
+        self._ignore_senders = set(ignore_senders)
+        self._owners = set(owners) if owners else None
+
+    def ignore_reason(self, event, payload, owner):
+        if event not in _EVENT_ACTIONS:
+            return "not a label or repository event"
+        actions = _EVENT_ACTIONS[event]
+        if actions is not None and payload.get('action') not in actions:
+            return "the '{0}' action doesn't change labels".format(payload.get('action'))
+        if (payload.get('sender') or {}).get('login') in self._ignore_senders:
+            return "sent by this daemon"
+        if self._owners is not None and owner not in self._owners:
+            return "not owned by one of the -o/--org organizations"
+        return None
+
+'''
+    Post a (recorded) webhook payload to a webhook server, signed with the
+    secret, the way GitHub delivers it. Returns the status and the response.
+
+    Arguments:
+        url: the URL the webhook server listens on
+        event: the X-GitHub-Event, e.g. "label"
+        body: the payload, as bytes
+        secret: the secret of the webhook
+'''
+def post_payload(url, event, body, secret):
+    request = urllib.request.Request(url, data=body, method='POST', headers={
+        'Content-Type': 'application/json',
+        'X-GitHub-Event': event,
+        'X-GitHub-Delivery': hashlib.sha1(body).hexdigest(),
+        'X-Hub-Signature-256': sign_payload(secret, body)
+    })
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, response.read().decode('utf-8')
+    except urllib.error.HTTPError as e:
+        return e.code, e.read().decode('utf-8')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Post recorded GitHub webhook payloads to a github_repo_sync webhook server, signed with its secret')
+    parser.add_argument('url', help='URL of the webhook server, e.g. http://127.0.0.1:8080/')
+    parser.add_argument('event', help='The X-GitHub-Event of the payloads, e.g. "label" or "repository"')
+    parser.add_argument('payloads', help='JSON files of the payloads to post', nargs='+')
+    parser.add_argument('--secret', help='Secret of the webhook', required=True)
+    args = parser.parse_args()
+    for path in args.payloads:
+        with open(path, 'rb') as file:
+            status, response = post_payload(args.url, args.event, file.read(), args.secret)
+        print("{0}: {1} {2}".format(path, status, response))
+        if status >= 400:
+            sys.exit(1)